@@ -0,0 +1,148 @@
+# Throughput and memory benchmarks for the simulation and the trainer.
+#
+#   python -m benchmarks.run_benchmarks --output bench.json
+#   python -m benchmarks.run_benchmarks --compare bench.json --tolerance 0.1
+#
+# --compare exits with status 1 if any result is worse than the baseline by
+# more than the tolerance, so it can gate a deploy.
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import simpy
+
+from src.simulation.environment import SimulationEnvironment
+from src.simulation.customer import TimePeriod, get_arrival_rate
+from src.agents.q_learning_agent import QLearningAgent, run_episode, reset_environment
+
+
+def result(value, unit, higher_is_better=True):
+    return {'value': value, 'unit': unit, 'higher_is_better': higher_is_better}
+
+
+def best_of(repeat, fn):
+    # Best wall time over several runs, which is the least noisy estimate
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        outcome = fn()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best[0]:
+            best = (elapsed, outcome)
+    return best
+
+
+def bench_simulation(minutes, repeat):
+    results = {}
+    for period in TimePeriod:
+        def run():
+            env = SimulationEnvironment(duration=minutes, seed=0, arrival_rate=get_arrival_rate(period))
+            for _ in range(minutes):
+                env.step()
+            return env.served_count
+
+        elapsed, served = best_of(repeat, run)
+        results[f'simulation.{period.name.lower()}.minutes_per_second'] = result(minutes / elapsed, 'min/s')
+        results[f'simulation.{period.name.lower()}.customers_per_second'] = result(served / elapsed, 'customers/s')
+    return results
+
+
+def bench_episodes(n_episodes, repeat):
+    results = {}
+    for event_driven in (False, True):
+        def run():
+            agent = QLearningAgent(n_actions=3, seed=0)
+            env = None
+            for episode in range(n_episodes):
+                env = reset_environment(env, episode)
+                run_episode(env, agent, episode, event_driven)
+
+        elapsed, _ = best_of(repeat, run)
+        name = 'event_driven' if event_driven else 'stepped'
+        results[f'training.{name}.episodes_per_second'] = result(n_episodes / elapsed, 'episodes/s')
+    return results
+
+
+def bench_memory():
+    tracemalloc.start()
+    agent = QLearningAgent(n_actions=3, seed=0)
+    env = SimulationEnvironment(seed=0)
+    run_episode(env, agent, 0)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'memory.q_table_bytes': result(agent.q_table.nbytes, 'bytes', higher_is_better=False),
+        'memory.queue_log_bytes': result(env.queue_log.nbytes, 'bytes', higher_is_better=False),
+        'memory.episode_peak_bytes': result(peak, 'bytes', higher_is_better=False),
+    }
+
+
+def run_all(minutes, n_episodes, repeat):
+    results = {}
+    results.update(bench_simulation(minutes, repeat))
+    results.update(bench_episodes(n_episodes, repeat))
+    results.update(bench_memory())
+    return {
+        'metadata': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'simpy': simpy.__version__,
+            'machine': platform.machine(),
+        },
+        'results': results,
+    }
+
+
+def compare(current, baseline, tolerance):
+    # Returns the names of results that regressed by more than tolerance
+    regressions = []
+    print(f"{'benchmark':50} {'baseline':>14} {'current':>14} {'change':>8}")
+    for name, entry in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None or base['value'] == 0:
+            print(f"{name:50} {'-':>14} {entry['value']:>14.1f}")
+            continue
+        change = entry['value'] / base['value'] - 1
+        worse = -change if entry['higher_is_better'] else change
+        flag = '  REGRESSION' if worse > tolerance else ''
+        print(f"{name:50} {base['value']:>14.1f} {entry['value']:>14.1f} {change:>+8.1%}{flag}")
+        if worse > tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulation and training throughput benchmarks")
+    parser.add_argument('--output', help="write results to this JSON file")
+    parser.add_argument('--compare', help="baseline JSON file to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="allowed relative slowdown (default 0.10)")
+    parser.add_argument('--minutes', type=int, default=1020, help="simulated minutes per load profile")
+    parser.add_argument('--episodes', type=int, default=5, help="episodes per training benchmark")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    current = run_all(args.minutes, args.episodes, args.repeat)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+            sys.exit(1)
+    else:
+        for name, entry in current['results'].items():
+            print(f"{name:50} {entry['value']:>14.1f} {entry['unit']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,32 @@
+import argparse
 from src.simulation.environment import SimulationEnvironment
-from src.agents.q_learning_agent import QLearningAgent, train_agent, plot_metrics,find_optimal_checkouts
+from src.agents.q_learning_agent import (QLearningAgent, train_agent, plot_metrics, find_optimal_checkouts,
+                                         load_checkpoint, find_checkpoint)
 from src.simulation.customer import TimePeriod, get_time_period
-import matplotlib.pyplot as plt
+from src.simulation.sim_logging import configure_logging
 
 def main():
-    # Train the agent
-    agent, rewards = train_agent(n_episodes=1000)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--checkpoint', help="directory to save the trained agent to, or answer from if it exists")
+    parser.add_argument('--retrain', action='store_true', help="train even if --checkpoint already holds an agent")
+    parser.add_argument('--resume', action='store_true', help="continue training from --checkpoint")
+    parser.add_argument('--episodes', type=int, default=1000)
+    parser.add_argument('--report', help="write plots (PNG) and an HTML summary to this directory instead of "
+                                         "showing them")
+    args = parser.parse_args()
 
-    # Plot the rewards
-    plt.figure(figsize=(12, 6))
-    plt.plot(rewards)
-    plt.title('Rewards over Episodes')
-    plt.xlabel('Episode')
-    plt.ylabel('Total Reward')
-    plt.show()
+    configure_logging('info')
+
+    if args.checkpoint and not (args.retrain or args.resume) and find_checkpoint(args.checkpoint) is not None:
+        # Answer from the stored table without retraining
+        agent, rewards = load_checkpoint(args.checkpoint, mmap_mode='r')
+    else:
+        # Train the agent
+        agent, rewards = train_agent(n_episodes=args.episodes, checkpoint_dir=args.checkpoint, resume=args.resume)
 
     # Find and print the optimal number of checkouts
     env = SimulationEnvironment()  # Create a sample environment
     optimal_checkouts = find_optimal_checkouts(agent, env)
-    plot_metrics(env)
 
     print("\nOptimal number of checkouts by hour and time period:")
     for hour in range(24):
@@ -26,6 +34,27 @@ def main():
         n_checkouts = optimal_checkouts[(hour, time_period)]
         print(f"Hour: {hour:02d}:00, Time Period: {time_period.name}, Optimal Checkouts: {n_checkouts}")
 
+    if args.report:
+        from src.agents.report import write_report
+        paths = write_report(args.report, rewards=rewards, queue_log=env.queue_log,
+                             optimal_checkouts=optimal_checkouts)
+        print(f"\nReport written to {paths[-1]}")
+    else:
+        show_plots(rewards, env, optimal_checkouts)
+
+def show_plots(rewards, env, optimal_checkouts):
+    import matplotlib.pyplot as plt
+
+    # Plot the rewards
+    plt.figure(figsize=(12, 6))
+    plt.plot(rewards)
+    plt.title('Rewards over Episodes')
+    plt.xlabel('Episode')
+    plt.ylabel('Total Reward')
+    plt.show()
+
+    plot_metrics(env)
+
     # Visualize optimal checkouts
     plt.figure(figsize=(12, 6))
     hours = range(24)
@@ -39,4 +68,4 @@ def main():
     plt.show()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,82 @@
+from collections import deque
+import numpy as np
+
+# Tracks training progress and decides when to stop early. After each update
+# (one episode, or one sync round when training in parallel) it records:
+#   - the moving average of episode rewards over reward_window episodes
+#   - max |delta Q| since the previous update
+#   - whether the greedy action changed in any state visited so far
+# Training has converged once the greedy policy has been unchanged for
+# `patience` consecutive updates after at least min_episodes episodes. The
+# optional q_tolerance and reward_tolerance add conditions on max |delta Q|
+# and on the relative change of the moving-average reward over the same span.
+class ConvergenceTracker:
+    def __init__(self, patience=50, min_episodes=100, reward_window=50, q_tolerance=None, reward_tolerance=None):
+        self.patience = patience
+        self.min_episodes = min_episodes
+        self.q_tolerance = q_tolerance
+        self.reward_tolerance = reward_tolerance
+
+        self._recent_rewards = deque(maxlen=reward_window)
+        self.moving_average_rewards = []
+        self.max_q_deltas = []
+        self.policy_changes = []  # states whose greedy action changed, per update
+        self.stable_updates = 0
+        self.n_episodes = 0
+        self.converged = False
+
+        self._previous_q = None
+        self._previous_policy = None
+        self._previous_visited = None
+
+    def update(self, q_table, episode_rewards):
+        for reward in episode_rewards:
+            self._recent_rewards.append(reward)
+        self.n_episodes += len(episode_rewards)
+        self.moving_average_rewards.append(float(np.mean(self._recent_rewards)))
+
+        policy = q_table.argmax(axis=1)
+        visited = (q_table != 0).any(axis=1)
+        if self._previous_q is None:
+            self._previous_q = np.array(q_table)
+            max_q_delta = float(np.abs(q_table).max())
+            policy_changes = int(visited.sum())
+        else:
+            max_q_delta = float(np.abs(q_table - self._previous_q).max())
+            np.copyto(self._previous_q, q_table)
+            # States first visited in this update have no previous greedy action to compare with
+            policy_changes = int((policy != self._previous_policy)[self._previous_visited].sum())
+        self._previous_policy = policy
+        self._previous_visited = visited
+        self.max_q_deltas.append(max_q_delta)
+        self.policy_changes.append(policy_changes)
+
+        if policy_changes == 0 and (self.q_tolerance is None or max_q_delta <= self.q_tolerance):
+            self.stable_updates += 1
+        else:
+            self.stable_updates = 0
+
+        self.converged = (self.n_episodes >= self.min_episodes and self.stable_updates >= self.patience
+                          and self._reward_settled())
+        return self.converged
+
+    def _reward_settled(self):
+        if self.reward_tolerance is None:
+            return True
+        if len(self.moving_average_rewards) <= self.patience:
+            return False
+        before = self.moving_average_rewards[-self.patience - 1]
+        now = self.moving_average_rewards[-1]
+        return abs(now - before) <= self.reward_tolerance * max(abs(before), 1e-9)
+
+
+# Per-episode exploration rate: start * decay ** episode, floored at end.
+# A class rather than a closure so it can be shipped to training workers.
+class ExponentialEpsilonDecay:
+    def __init__(self, start=1.0, end=0.01, decay=0.995):
+        self.start = start
+        self.end = end
+        self.decay = decay
+
+    def __call__(self, episode):
+        return max(self.end, self.start * self.decay ** episode)
@@ -0,0 +1,97 @@
+import cProfile
+import pstats
+import time
+
+# Per-phase timers and counters for run_episode. Pass an Instrumentation as
+# run_episode(..., instrumentation=...) or train_agent(..., instrumentation=...);
+# with the default of None the episode loop only pays a few None checks.
+PHASES = ('choose_action', 'env_step', 'get_state', 'reward', 'learn', 'logging')
+
+class Instrumentation:
+    def __init__(self):
+        self.episodes = []  # one summary dict per finished episode
+        self._timers = None
+        self._events_processed = 0
+        self._decisions = 0
+        self._episode_start = 0.0
+        self._last = 0.0
+
+    def start_episode(self, env):
+        self._timers = dict.fromkeys(PHASES, 0.0)
+        self._events_processed = 0
+        self._decisions = 0
+        self._count_events(env)
+        self._episode_start = self._last = time.perf_counter()
+
+    def _count_events(self, env):
+        # Environment.run() dispatches through self.step(), so shadowing it on
+        # this one instance counts every processed SimPy event
+        sim = env.env
+        step = sim.step
+
+        def counting_step():
+            self._events_processed += 1
+            step()
+
+        sim.step = counting_step
+
+    def lap(self, phase):
+        # Charges the time since the previous lap to phase
+        now = time.perf_counter()
+        self._timers[phase] += now - self._last
+        self._last = now
+
+    def count_decision(self):
+        self._decisions += 1
+
+    def end_episode(self, env, agent, episode, total_reward):
+        q_table = agent.q_table
+        summary = {
+            'episode': episode,
+            'total_reward': total_reward,
+            'wall_seconds': time.perf_counter() - self._episode_start,
+            'phase_seconds': self._timers,
+            'decisions': self._decisions,
+            'simulated_minutes': env.current_time,
+            'events_processed': self._events_processed,
+            'customers_generated': env.customer_count,
+            'customers_served': env.served_count,
+            'customers_alive': env.customer_count - env.served_count,
+            'q_table_bytes': q_table.nbytes,
+            'q_states_visited': int((q_table != 0).any(axis=1).sum()),
+        }
+        self.episodes.append(summary)
+        del env.env.step  # back to the class method
+        return summary
+
+    def totals(self):
+        # Phase seconds and counters summed over all recorded episodes
+        phase_seconds = dict.fromkeys(PHASES, 0.0)
+        for summary in self.episodes:
+            for phase, seconds in summary['phase_seconds'].items():
+                phase_seconds[phase] += seconds
+        return {
+            'episodes': len(self.episodes),
+            'wall_seconds': sum(s['wall_seconds'] for s in self.episodes),
+            'phase_seconds': phase_seconds,
+            'decisions': sum(s['decisions'] for s in self.episodes),
+            'events_processed': sum(s['events_processed'] for s in self.episodes),
+        }
+
+
+def profile_training(output_path=None, sort='cumulative', limit=30, **train_kwargs):
+    # Runs train_agent under cProfile. The raw stats go to output_path (load
+    # them with pstats or snakeviz) and the top `limit` entries are printed.
+    from src.agents.q_learning_agent import train_agent
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        agent, rewards = train_agent(**train_kwargs)
+    finally:
+        profiler.disable()
+
+    if output_path is not None:
+        profiler.dump_stats(output_path)
+    pstats.Stats(profiler).sort_stats(sort).print_stats(limit)
+    return agent, rewards
@@ -0,0 +1,218 @@
+# Serves a trained Q-table to live stores. Stores send their per-lane queue
+# lengths and the minute of day; the answer is the greedy action, with the same
+# encoding as run_episode (0 = hold, 1 = add a lane, 2 = remove a lane).
+# Requests are micro-batched: they are queued as they arrive and answered
+# together, one encode_many() and one argmax per batch.
+#
+#   python -m src.agents.policy_service --checkpoint ckpt --stores 2000 --minutes 120
+#
+# replays recorded queue_log traces against an in-process service and prints
+# the decision latency and throughput. --port serves JSON lines over TCP
+# instead.
+import argparse
+import asyncio
+import json
+import time
+from collections import namedtuple
+import numpy as np
+from src.simulation.customer import MINUTES_PER_DAY, PERIOD_INDEX_BY_MINUTE
+from src.simulation.environment import SimulationEnvironment
+from src.simulation.sim_logging import logger, configure_logging
+from src.agents.q_learning_agent import QLearningAgent, load_checkpoint, warm_start_q_table
+
+ACTION_NAMES = ('hold', 'add', 'remove')
+
+class PolicyService:
+    def __init__(self, agent, max_batch_size=4096, max_delay=0.0005):
+        # max_delay: seconds a batch is held open for more requests once the
+        # first one has arrived; 0 only yields to tasks that are already ready
+        self.agent = agent
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.batches = 0
+        self.decisions = 0
+        self.largest_batch = 0
+        self._pending = []  # (avg_queue_length, minute_of_day, n_checkouts, future)
+        self._wakeup = None
+        self._task = None
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._serve_batches())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    async def decide(self, queue_lengths, minute_of_day):
+        # queue_lengths: one entry per open checkout. A malformed observation
+        # raises ValueError here, for this caller only, and never reaches a batch.
+        avg_queue_length, minute_of_day, n_checkouts = self._parse(queue_lengths, minute_of_day)
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((avg_queue_length, minute_of_day, n_checkouts, future))
+        self._wakeup.set()
+        return await future
+
+    @staticmethod
+    def _parse(queue_lengths, minute_of_day):
+        try:
+            lengths = [float(length) for length in queue_lengths]
+            minute = int(minute_of_day)
+        except (TypeError, ValueError) as error:
+            raise ValueError(f"Invalid observation: queue_lengths={queue_lengths!r}, "
+                             f"minute_of_day={minute_of_day!r}") from error
+        if not all(0 <= length < float('inf') for length in lengths):
+            raise ValueError(f"Queue lengths must be finite and non-negative, got {queue_lengths!r}")
+        n_checkouts = len(lengths)
+        return (sum(lengths) / n_checkouts if n_checkouts else 0), minute, n_checkouts
+
+    async def _serve_batches(self):
+        while True:
+            await self._wakeup.wait()
+            if len(self._pending) < self.max_batch_size:
+                await asyncio.sleep(self.max_delay)
+            self._wakeup.clear()
+            pending, self._pending = self._pending, []
+            for start in range(0, len(pending), self.max_batch_size):
+                batch = pending[start:start + self.max_batch_size]
+                try:
+                    self._answer(batch)
+                except Exception as error:
+                    # Fail this batch's callers and keep serving everyone else
+                    logger.exception("Policy lookup failed for a batch of %d requests", len(batch))
+                    for *_, future in batch:
+                        if not future.done():
+                            future.set_exception(error)
+
+    def _answer(self, batch):
+        avg_queue_lengths, minutes, n_checkouts, futures = zip(*batch)
+        periods = PERIOD_INDEX_BY_MINUTE[np.asarray(minutes, dtype=np.int64) % MINUTES_PER_DAY]
+        states = self.agent.encoder.encode_many(avg_queue_lengths, periods, n_checkouts)
+        actions = self.agent.q_table[states].argmax(axis=1).tolist()
+        for future, action in zip(futures, actions):
+            if not future.done():  # the caller may have given up
+                future.set_result(action)
+        self.batches += 1
+        self.decisions += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+
+
+async def handle_connection(service, reader, writer):
+    # One JSON object per line each way:
+    #   {"store": "s1", "queue_lengths": [2, 0, 3], "minute": 540}
+    #   {"store": "s1", "action": 1, "decision": "add"}
+    # A request that cannot be answered gets {"store": ..., "error": "..."}
+    # and the connection stays open.
+    try:
+        while line := await reader.readline():
+            store = None
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("request must be a JSON object")
+                store = request.get('store')
+                action = await service.decide(request['queue_lengths'], request['minute'])
+                response = {'store': store, 'action': action, 'decision': ACTION_NAMES[action]}
+            except KeyError as error:
+                response = {'store': store, 'error': f"missing field {error}"}
+            except ValueError as error:  # includes json.JSONDecodeError
+                response = {'store': store, 'error': str(error)}
+            writer.write(json.dumps(response).encode() + b'\n')
+            await writer.drain()
+    finally:
+        writer.close()
+
+async def serve(service, host='127.0.0.1', port=8765):
+    async with service:
+        server = await asyncio.start_server(lambda r, w: handle_connection(service, r, w), host, port)
+        logger.info("Policy service listening on %s:%d", host, port)
+        async with server:
+            await server.serve_forever()
+
+
+ReplayStats = namedtuple('ReplayStats', [
+    'stores', 'decisions', 'seconds', 'decisions_per_second', 'p50_ms', 'p99_ms', 'max_ms',
+    'batches', 'largest_batch',
+])
+
+def trace_from_queue_log(queue_log):
+    # [(minute, [queue length per open lane]), ...] from a QueueLog
+    queue_lengths = queue_log.queue_lengths
+    n_checkouts = queue_log.n_checkouts
+    return [(int(t), queue_lengths[i, :n_checkouts[i]].tolist()) for i, t in enumerate(queue_log.times)]
+
+def record_traces(n_traces=8, minutes=1020, seed=0):
+    # Queue traces from fresh simulations with the default lanes
+    traces = []
+    for seed_i in np.random.SeedSequence(seed).generate_state(n_traces):
+        env = SimulationEnvironment(duration=minutes, seed=int(seed_i))
+        while env.current_time < env.duration:
+            env.step()
+        traces.append(trace_from_queue_log(env.queue_log))
+    return traces
+
+async def replay_traces(service, traces, n_stores, start_minute=0):
+    # Every store streams its trace (store i replays traces[i % len(traces)])
+    # as fast as answers come back; returns latency and throughput figures
+    latencies = []
+
+    async def store_client(trace):
+        for minute, queue_lengths in trace:
+            start = time.perf_counter()
+            await service.decide(queue_lengths, start_minute + minute)
+            latencies.append(time.perf_counter() - start)
+
+    batches_before = service.batches
+    start = time.perf_counter()
+    await asyncio.gather(*(store_client(traces[i % len(traces)]) for i in range(n_stores)))
+    seconds = time.perf_counter() - start
+
+    latencies_ms = np.array(latencies) * 1000
+    return ReplayStats(n_stores, len(latencies), seconds, len(latencies) / seconds,
+                       float(np.percentile(latencies_ms, 50)), float(np.percentile(latencies_ms, 99)),
+                       float(latencies_ms.max()), service.batches - batches_before, service.largest_batch)
+
+async def load_test(agent, n_stores=1000, minutes=120, n_traces=8, seed=0, **service_kwargs):
+    traces = record_traces(n_traces, minutes, seed)
+    async with PolicyService(agent, **service_kwargs) as service:
+        return await replay_traces(service, traces, n_stores)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--checkpoint', help="trained agent directory; without it a warm-started table is used")
+    parser.add_argument('--stores', type=int, default=1000)
+    parser.add_argument('--minutes', type=int, default=120)
+    parser.add_argument('--max-batch-size', type=int, default=4096)
+    parser.add_argument('--max-delay', type=float, default=0.0005, help="seconds")
+    parser.add_argument('--port', type=int, help="serve over TCP on this port instead of running the replay")
+    args = parser.parse_args()
+
+    configure_logging('info')
+    if args.checkpoint:
+        agent, _ = load_checkpoint(args.checkpoint, mmap_mode='r')
+    else:
+        agent = QLearningAgent(n_actions=3)
+        warm_start_q_table(agent)
+    service_kwargs = {'max_batch_size': args.max_batch_size, 'max_delay': args.max_delay}
+
+    if args.port is not None:
+        asyncio.run(serve(PolicyService(agent, **service_kwargs), port=args.port))
+        return
+    stats = asyncio.run(load_test(agent, args.stores, args.minutes, **service_kwargs))
+    for name, value in stats._asdict().items():
+        print(f"{name}: {value:.3f}" if isinstance(value, float) else f"{name}: {value}")
+
+if __name__ == "__main__":
+    main()
@@ -1,43 +1,142 @@
+import copy
+import json
+import os
+import shutil
 import numpy as np
-import matplotlib.pyplot as plt
-from collections import defaultdict
-from src.simulation.environment import SimulationEnvironment
-from src.simulation.customer import TimePeriod
+from concurrent.futures import ProcessPoolExecutor
+from src.simulation.environment import SimulationEnvironment, DEFAULT_ARRIVAL_RATE
+from src.simulation.customer import TimePeriod, CustomerType
+from src.simulation.queueing_model import estimate_period
+from src.simulation.sim_logging import logger
+from src.simulation.rng import BatchedRandom, make_generator
+from src.agents.state_encoder import StateEncoder
+
+CHECKPOINT_FORMAT_VERSION = 1
 
 class QLearningAgent:
-    def __init__(self, n_actions, learning_rate=0.1, discount_factor=0.95, exploration_rate=0.1):
-        self.q_table = defaultdict(lambda: np.zeros(n_actions))
+    def __init__(self, n_actions, learning_rate=0.1, discount_factor=0.95, exploration_rate=0.1, encoder=None,
+                 seed=None):
+        self.n_actions = n_actions
+        self.reseed(seed)
+        self.encoder = encoder if encoder is not None else StateEncoder()
+        # One row per encoded state, allocated up front
+        self.q_table = np.zeros((self.encoder.n_states, n_actions), dtype=np.float32)
         self.lr = learning_rate
         self.gamma = discount_factor
         self.epsilon = exploration_rate
 
+    def reseed(self, seed):
+        # Exploration draws come from their own stream of the seed
+        self.rng = BatchedRandom(make_generator(seed, 'exploration'))
+
+    def hyperparameters(self):
+        return {
+            'learning_rate': self.lr,
+            'discount_factor': self.gamma,
+            'exploration_rate': self.epsilon,
+            'encoder': self.encoder,
+        }
+
     def get_state(self, env):
         avg_queue_length = env.get_average_queue_length()
         time_period = env.get_current_time_period()
-        return (avg_queue_length, time_period)
+        return self.encoder.encode(avg_queue_length, time_period, len(env.checkouts))
 
     def choose_action(self, state):
-        if np.random.random() < self.epsilon:
-            return np.random.choice(len(self.q_table[state]))
+        if self.rng.random() < self.epsilon:
+            return self.rng.integers(self.n_actions)
         else:
-            return np.argmax(self.q_table[state])
+            return int(self.q_table[state].argmax())
+
+    def learn(self, state, action, reward, next_state, n_steps=1):
+        # n_steps > 1 for transitions spanning several minutes, where reward is
+        # already the discounted sum over those minutes
+        current_q = self.q_table[state, action]
+        next_max_q = self.q_table[next_state].max()
+        discount = self.gamma if n_steps == 1 else self.gamma ** n_steps
+        self.q_table[state, action] = current_q + self.lr * (reward + discount * next_max_q - current_q)
+
+    def learn_batch(self, states, actions, rewards, next_states, discounts):
+        # learn() over a minibatch of transitions, all measured against the
+        # current table. A (state, action) pair drawn several times gets the
+        # mean of its TD errors, so duplicates do not multiply the step size.
+        td_error = rewards + discounts * self.q_table[next_states].max(axis=1) - self.q_table[states, actions]
+        flat = states.astype(np.int64) * self.n_actions + actions
+        # unique() sorts the batch only, so the cost does not grow with the table
+        _, inverse, counts = np.unique(flat, return_inverse=True, return_counts=True)
+        np.add.at(self.q_table.reshape(-1), flat, self.lr * td_error / counts[inverse])
 
-    def learn(self, state, action, reward, next_state):
-        current_q = self.q_table[state][action]
-        next_max_q = np.max(self.q_table[next_state])
-        new_q = current_q + self.lr * (reward + self.gamma * next_max_q - current_q)
-        self.q_table[state][action] = new_q
+    # A saved agent is a directory holding q_table.npy (raw float32, so it can be
+    # memory-mapped) and agent.json with the state encoding and hyperparameters.
+    # Each file is written under a temporary name and swapped in, so an
+    # interrupted save never leaves a partial file, but the two files can then
+    # come from different saves. save_checkpoint swaps in whole directories.
+    def save(self, path, **metadata):
+        os.makedirs(path, exist_ok=True)
+        header = {
+            'format_version': CHECKPOINT_FORMAT_VERSION,
+            'n_actions': self.n_actions,
+            'learning_rate': self.lr,
+            'discount_factor': self.gamma,
+            'exploration_rate': self.epsilon,
+            'encoder': self.encoder.config(),
+        }
+        header.update(metadata)
 
-def run_episode(env, agent, episode):
+        q_table_path = os.path.join(path, 'q_table.npy')
+        with open(q_table_path + '.tmp', 'wb') as f:
+            np.save(f, self.q_table)
+        os.replace(q_table_path + '.tmp', q_table_path)
+
+        header_path = os.path.join(path, 'agent.json')
+        with open(header_path + '.tmp', 'w') as f:
+            json.dump(header, f, indent=2)
+        os.replace(header_path + '.tmp', header_path)
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        # mmap_mode='r' maps the table read-only, for answering queries
+        # without reading it into memory; use None to keep training it
+        with open(os.path.join(path, 'agent.json')) as f:
+            header = json.load(f)
+        if header['format_version'] != CHECKPOINT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported checkpoint format version {header['format_version']} in {path}")
+
+        agent = cls(header['n_actions'],
+                    learning_rate=header['learning_rate'],
+                    discount_factor=header['discount_factor'],
+                    exploration_rate=header['exploration_rate'],
+                    encoder=StateEncoder(**header['encoder']))
+        q_table = np.load(os.path.join(path, 'q_table.npy'), mmap_mode=mmap_mode)
+        if q_table.shape != agent.q_table.shape:
+            raise ValueError(f"Q-table shape {q_table.shape} in {path} does not match its state encoding "
+                             f"{agent.q_table.shape}")
+        agent.q_table = q_table
+        agent.metadata = header
+        return agent
+
+def run_episode(env, agent, episode, event_driven=False, instrumentation=None, replay=None):
+    # With a ReplayBuffer, transitions are stored and the agent learns from
+    # sampled minibatches whenever the buffer says an update is due, instead
+    # of one learn() call per transition
+    probe = instrumentation
+    if probe is not None:
+        probe.start_episode(env)
+    
     state = agent.get_state(env)
     total_reward = 0
     
-    print(f"Starting episode {episode}")
+    logger.info("Starting episode %d", episode)
+    if probe is not None:
+        probe.lap('logging')
     
-    for step in range(env.duration):
+    while env.current_time < env.duration:
         action = agent.choose_action(state)
+        if probe is not None:
+            probe.count_decision()
+            probe.lap('choose_action')
         
-        #print(f"Step {step}: Chosen action: {action}")
+        #print(f"Step {env.current_time}: Chosen action: {action}")
         
         if action == 0:  # Do nothing
             pass
@@ -48,20 +147,48 @@ def run_episode(env, agent, episode):
             env.remove_checkout()
             #print(f"Removed checkout. Total checkouts: {len(env.checkouts)}")
         
+        n_idle = 0
+        if event_driven:
+            n_idle = env.skip_idle_minutes(env.minutes_until_decision() - 1)
+            # Nothing changed during the skipped minutes, so each of them
+            # earned the reward of the current state
+            idle_reward = calculate_reward(env) if n_idle else 0
+        
         env.step()
+        if probe is not None:
+            probe.lap('env_step')
         
         reward = calculate_reward(env)
-        total_reward += reward
+        
+        if n_idle:
+            total_reward += n_idle * idle_reward + reward
+            discount = agent.gamma ** n_idle
+            reward = idle_reward * (1 - discount) / (1 - agent.gamma) + discount * reward
+        else:
+            total_reward += reward
+        if probe is not None:
+            probe.lap('reward')
         
         next_state = agent.get_state(env)
+        if probe is not None:
+            probe.lap('get_state')
         
-        agent.learn(state, action, reward, next_state)
+        if replay is None:
+            agent.learn(state, action, reward, next_state, n_idle + 1)
+        elif replay.add(state, action, reward, next_state, agent.gamma ** (n_idle + 1)):
+            agent.learn_batch(*replay.sample())
+        if probe is not None:
+            probe.lap('learn')
         
         state = next_state
         
-        #print(f"Step {step} completed. Reward: {reward}, Total reward: {total_reward}")
+        #print(f"Step {env.current_time} completed. Reward: {reward}, Total reward: {total_reward}")
     
-    print(f"Episode {episode} completed with total reward: {total_reward}")
+    logger.info("Episode %d completed with total reward: %s", episode, total_reward)
+    if probe is not None:
+        probe.lap('logging')
+        summary = probe.end_episode(env, agent, episode, total_reward)
+        logger.debug("Episode %d summary: %s", episode, summary)
     return total_reward
 
 
@@ -82,26 +209,233 @@ def calculate_reward(env):
     
     return reward
 
-def train_agent(n_episodes=1000):
-    agent = QLearningAgent(n_actions=3)
-    rewards = []
+def calculate_rewards(avg_queue_lengths, n_checkouts):
+    # calculate_reward over arrays of stores, e.g. from VectorSimulationEnvironment
+    avg_queue_lengths = np.asarray(avg_queue_lengths, dtype=float)
+    n_checkouts = np.asarray(n_checkouts)
+    reward = -avg_queue_lengths - 0.5 * n_checkouts
+    reward -= np.where(avg_queue_lengths > 2.5, (avg_queue_lengths - 2.5) ** 2, 0)
+    reward -= np.where(n_checkouts > 4, (n_checkouts - 5) ** 2, 0)
+    return reward
+
+def train_agent(n_episodes=1000, n_workers=1, episodes_per_sync=8, seed=None, event_driven=False,
+                checkpoint_dir=None, checkpoint_every=100, resume=False, instrumentation=None, warm_start=False,
+                convergence=None, epsilon_schedule=None, replay=None):
+    # convergence: a ConvergenceTracker; training stops once it reports convergence
+    # epsilon_schedule: callable episode -> exploration rate, e.g. ExponentialEpsilonDecay
+    # replay: a ReplayBuffer to learn from minibatches, kept across episodes
+    if n_workers > 1:
+        if instrumentation is not None:
+            raise ValueError("instrumentation is only supported for single-process training")
+        return train_agent_parallel(n_episodes, n_workers, episodes_per_sync, seed, event_driven=event_driven,
+                                    checkpoint_dir=checkpoint_dir, checkpoint_every=checkpoint_every,
+                                    resume=resume, warm_start=warm_start, convergence=convergence,
+                                    epsilon_schedule=epsilon_schedule, replay=replay)
+
+    agent, rewards = load_or_create_agent(checkpoint_dir, resume, warm_start)
+    episode_seeds = get_episode_seeds(seed, n_episodes)
+    env = None  # one environment, reset for every episode
     
-    for episode in range(n_episodes):
+    for episode in range(len(rewards), n_episodes):
         #print(f"\nStarting episode {episode}")
-        env = SimulationEnvironment()
-        episode_reward = run_episode(env, agent, episode)
+        episode_seed = None
+        if episode_seeds is not None:
+            episode_seed = episode_seeds[episode]
+            agent.reseed(episode_seed)
+            if replay is not None:
+                replay.reseed(episode_seed)
+        if epsilon_schedule is not None:
+            agent.epsilon = epsilon_schedule(episode)
+        env = reset_environment(env, episode_seed)
+        episode_reward = run_episode(env, agent, episode, event_driven, instrumentation, replay)
         rewards.append(episode_reward)
         #print(f"Episode {episode} completed. Total reward: {episode_reward}")
+        if checkpoint_dir is not None and (episode + 1) % checkpoint_every == 0:
+            save_checkpoint(agent, rewards, checkpoint_dir, seed)
+        if convergence is not None and convergence.update(agent.q_table, [episode_reward]):
+            logger.info("Policy converged after %d episodes", episode + 1)
+            break
+    if env is not None:
+        env.close()
     
+    if checkpoint_dir is not None:
+        save_checkpoint(agent, rewards, checkpoint_dir, seed)
     return agent, rewards
 
+def reset_environment(env, seed=None):
+    # The training environment for the next episode: env reset in place, or a
+    # new one the first time
+    if env is None:
+        return SimulationEnvironment(seed=seed)
+    env.reset(seed)
+    return env
+
+def save_checkpoint(agent, rewards, checkpoint_dir, seed=None):
+    # The checkpoint is written in full to a sibling directory and renamed into
+    # place, so the table, header and rewards on disk always come from the
+    # same save. The previous checkpoint is kept as <dir>.old until the new
+    # one is in place.
+    checkpoint_dir = os.path.normpath(checkpoint_dir)
+    staging, previous = checkpoint_dir + '.tmp', checkpoint_dir + '.old'
+    shutil.rmtree(staging, ignore_errors=True)
+    agent.save(staging, episodes_completed=len(rewards), seed=seed)
+    np.save(os.path.join(staging, 'rewards.npy'), np.asarray(rewards, dtype=np.float64))
+    if os.path.exists(checkpoint_dir):
+        shutil.rmtree(previous, ignore_errors=True)
+        os.rename(checkpoint_dir, previous)
+    os.rename(staging, checkpoint_dir)
+    shutil.rmtree(previous, ignore_errors=True)
+
+def find_checkpoint(checkpoint_dir):
+    # The directory holding the latest complete checkpoint, or None. That is
+    # <dir>.old if a save was interrupted between its two renames.
+    checkpoint_dir = os.path.normpath(checkpoint_dir)
+    for path in (checkpoint_dir, checkpoint_dir + '.old'):
+        if os.path.exists(os.path.join(path, 'agent.json')):
+            return path
+    return None
+
+def load_checkpoint(checkpoint_dir, mmap_mode=None):
+    path = find_checkpoint(checkpoint_dir)
+    if path is None:
+        raise FileNotFoundError(f"No checkpoint in {checkpoint_dir}")
+    agent = QLearningAgent.load(path, mmap_mode=mmap_mode)
+    rewards_path = os.path.join(path, 'rewards.npy')
+    rewards = np.load(rewards_path).tolist() if os.path.exists(rewards_path) else []
+    episodes_completed = agent.metadata.get('episodes_completed')
+    if episodes_completed is not None and episodes_completed != len(rewards):
+        raise ValueError(f"Checkpoint {path} records {episodes_completed} episodes but holds "
+                         f"{len(rewards)} rewards")
+    return agent, rewards
+
+def load_or_create_agent(checkpoint_dir, resume, warm_start=False):
+    # Resuming continues from the episode after the last checkpoint; episode
+    # seeds are indexed by episode number, so a resumed seeded run matches an
+    # uninterrupted one from that point on
+    if resume and checkpoint_dir is not None and find_checkpoint(checkpoint_dir) is not None:
+        agent, rewards = load_checkpoint(checkpoint_dir)
+        logger.info("Resuming from %s after %d episodes", checkpoint_dir, len(rewards))
+        return agent, rewards
+    agent = QLearningAgent(n_actions=3)
+    if warm_start:
+        # Training episodes use SimulationEnvironment's flat arrival rate
+        # with every customer type equally likely
+        warm_start_q_table(agent, DEFAULT_ARRIVAL_RATE, [1 / len(CustomerType)] * len(CustomerType))
+    return agent, []
+
+def get_episode_seeds(seed, n_episodes):
+    # One independent seed per episode, so an episode replays identically
+    # no matter which worker (or how many workers) ends up running it
+    if seed is None:
+        return None
+    return [int(s) for s in np.random.SeedSequence(seed).generate_state(n_episodes)]
+
+def train_agent_parallel(n_episodes=1000, n_workers=4, episodes_per_sync=8, seed=0, event_driven=False,
+                         checkpoint_dir=None, checkpoint_every=100, resume=False, warm_start=False,
+                         convergence=None, epsilon_schedule=None, replay=None):
+    # Each sync round hands every worker a snapshot of the shared q_table and
+    # a block of episodes. The workers train local copies and the changes are
+    # averaged back into the shared table before the next round starts.
+    # Convergence is checked once per sync round. With replay, every worker
+    # slot keeps its own copy of the buffer: it is shipped with the slot's job
+    # and returned with the results, so transitions carry over between rounds.
+    # Only Q-values are merged; the replay passed in is just the template.
+    agent, rewards = load_or_create_agent(checkpoint_dir, resume, warm_start)
+    episode_seeds = get_episode_seeds(seed, n_episodes)
+    round_size = n_workers * episodes_per_sync
+    replays = [copy.deepcopy(replay) for _ in range(n_workers)] if replay is not None else [None] * n_workers
+
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        for round_start in range(len(rewards), n_episodes, round_size):
+            snapshot = agent.q_table.copy()
+            jobs = []
+            for worker_start in range(round_start, min(round_start + round_size, n_episodes), episodes_per_sync):
+                episodes = range(worker_start, min(worker_start + episodes_per_sync, n_episodes))
+                seeds = [episode_seeds[e] for e in episodes] if episode_seeds is not None else None
+                jobs.append((snapshot, agent.n_actions, agent.hyperparameters(), list(episodes), seeds, event_driven,
+                             epsilon_schedule, replays[len(jobs)]))
+
+            # map() yields results in submission order, so the merge (and the
+            # reward curve) does not depend on which worker finishes first
+            results = list(pool.map(_train_worker, jobs))
+            merge_q_tables(agent, snapshot, [q_table for q_table, _, _ in results])
+            for slot, (_, worker_rewards, worker_replay) in enumerate(results):
+                rewards.extend(worker_rewards)
+                replays[slot] = worker_replay
+
+            # Checkpoints can only be taken at sync points
+            if checkpoint_dir is not None and len(rewards) // checkpoint_every > round_start // checkpoint_every:
+                save_checkpoint(agent, rewards, checkpoint_dir, seed)
+            if convergence is not None and convergence.update(agent.q_table, rewards[round_start:]):
+                logger.info("Policy converged after %d episodes", len(rewards))
+                break
+
+    if checkpoint_dir is not None:
+        save_checkpoint(agent, rewards, checkpoint_dir, seed)
+    return agent, rewards
+
+def _train_worker(job):
+    snapshot, n_actions, hyperparameters, episodes, seeds, event_driven, epsilon_schedule, replay = job
+    agent = QLearningAgent(n_actions, **hyperparameters)
+    agent.q_table[:] = snapshot
+
+    rewards = []
+    env = None
+    for i, episode in enumerate(episodes):
+        episode_seed = None
+        if seeds is not None:
+            episode_seed = seeds[i]
+            agent.reseed(episode_seed)
+            if replay is not None:
+                replay.reseed(episode_seed)
+        if epsilon_schedule is not None:
+            agent.epsilon = epsilon_schedule(episode)
+        env = reset_environment(env, episode_seed)
+        rewards.append(run_episode(env, agent, episode, event_driven, replay=replay))
+    if env is not None:
+        env.close()
+    return agent.q_table, rewards, replay
+
+def merge_q_tables(agent, snapshot, local_tables):
+    # Average each entry's change relative to the snapshot over the workers
+    # that actually changed it. Averaging over all workers would shrink the
+    # update of a rarely visited entry by the number of workers that never
+    # saw it.
+    deltas = np.stack([local_table - snapshot for local_table in local_tables])
+    n_changed = np.count_nonzero(deltas, axis=0)
+    agent.q_table[:] = snapshot + deltas.sum(axis=0) / np.maximum(n_changed, 1)
+
+def warm_start_q_table(agent, arrival_rate=None, type_probabilities=None):
+    # Fills every state's Q-values with the discounted steady-state reward of
+    # the lane count each action leads to, using the queueing-model estimate
+    # of the average queue for that count: Q(s, a) = r(n') / (1 - gamma).
+    # arrival_rate and type_probabilities default to each period's
+    # customer.py values.
+    encoder = agent.encoder
+    counts = np.arange(encoder.min_checkouts, encoder.max_checkouts + 1)
+    # Lane count after each action, mirroring add_checkout/remove_checkout
+    next_counts = np.stack([counts, counts + 1, np.where(counts > 3, counts - 1, counts)], axis=1)
+
+    # The state index is ((queue_bin * n_periods) + period) * n_checkout_bins + checkout_bin
+    q_view = agent.q_table.reshape(encoder.n_queue_bins, encoder.n_periods, encoder.n_checkout_bins, agent.n_actions)
+    for period in TimePeriod:
+        avg_queue = {}
+        for n in np.unique(next_counts):
+            estimate = estimate_period(period, int(n), arrival_rate, type_probabilities)
+            avg_queue[n] = min(estimate.expected_queue_per_lane, encoder.max_queue_length)
+        avg_queue_by_action = np.vectorize(avg_queue.get)(next_counts)
+        values = calculate_rewards(avg_queue_by_action, next_counts) / (1 - agent.gamma)
+        q_view[:, period.value] = values[np.newaxis, :, :agent.n_actions]
+
 def find_optimal_strategy(agent):
     optimal_strategy = {}
+    encoder = agent.encoder
     for time_period in TimePeriod:
         for avg_queue_length in range(0, 21):  # Assuming max average queue length of 20
-            state = (avg_queue_length, time_period)
-            action = np.argmax(agent.q_table[state])
-            optimal_strategy[state] = action
+            for n_checkouts in range(encoder.min_checkouts, encoder.max_checkouts + 1):
+                state = encoder.encode(avg_queue_length, time_period, n_checkouts)
+                action = int(agent.q_table[state].argmax())
+                optimal_strategy[(avg_queue_length, time_period, n_checkouts)] = action
     return optimal_strategy
 
 
@@ -109,29 +443,36 @@ def find_optimal_checkouts(agent, env):
     optimal_checkouts = {}
     for time_period in TimePeriod:
         for hour in range(24):
-            state = (0, time_period)  # Start with 0 average queue length
             n_checkouts = env.initial_counters  # Start with initial number of counters
+            state = agent.encoder.encode(0, time_period, n_checkouts)  # Start with 0 average queue length
             
             # Simulate decision making for this hour
             for _ in range(60):  # Assume decisions can be made every minute
-                action = np.argmax(agent.q_table[state])
+                action = int(agent.q_table[state].argmax())
                 if action == 1:  # Add checkout
                     n_checkouts += 1
                 elif action == 2 and n_checkouts > 3:  # Remove checkout, but keep at least 3
                     n_checkouts -= 1
                 
                 # Update state (assume average queue length stays at 0 for simplicity)
-                state = (0, time_period)
+                state = agent.encoder.encode(0, time_period, n_checkouts)
             
             optimal_checkouts[(hour, time_period)] = n_checkouts
     
     return optimal_checkouts
 
-def plot_metrics(env):
+def plot_metrics(env, output_dir=None):
+    # With output_dir the plots are written there as files (see report.py)
+    # instead of being shown interactively
+    if output_dir is not None:
+        from src.agents.report import write_report
+        return write_report(output_dir, queue_log=env.queue_log)
+    import matplotlib.pyplot as plt
+
     # Extracting logged data
-    times = [log[0] for log in env.queue_log]
-    avg_queue_lengths = [np.mean(log[1]) for log in env.queue_log]
-    num_checkouts = [log[2] for log in env.queue_log]
+    times = env.queue_log.times
+    avg_queue_lengths = env.queue_log.average_queue_lengths()
+    num_checkouts = env.queue_log.n_checkouts
     
     # Plotting Average Queue Length over Time
     plt.figure(figsize=(12, 6))
@@ -0,0 +1,55 @@
+import numpy as np
+from src.simulation.rng import make_generator
+
+# Fixed-size ring buffer of transitions in preallocated arrays. discount is the
+# factor applied to the next state's value, gamma ** n_steps, so transitions
+# spanning skipped idle minutes can be replayed alongside one-minute ones.
+# Once batch_size transitions are stored, every update_every-th add() reports
+# that a minibatch update is due (see run_episode).
+class ReplayBuffer:
+    def __init__(self, capacity=100_000, batch_size=64, update_every=4, seed=None):
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.update_every = update_every
+        self.states = np.zeros(capacity, dtype=np.int32)
+        self.actions = np.zeros(capacity, dtype=np.int8)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.next_states = np.zeros(capacity, dtype=np.int32)
+        self.discounts = np.zeros(capacity, dtype=np.float32)
+        self.size = 0
+        self.position = 0
+        self.n_added = 0
+        self.reseed(seed)
+
+    def reseed(self, seed):
+        self.rng = make_generator(seed, 'replay')
+
+    def __len__(self):
+        return self.size
+
+    def add(self, state, action, reward, next_state, discount):
+        # Returns True when a minibatch update is due
+        i = self.position
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.next_states[i] = next_state
+        self.discounts[i] = discount
+        self.position = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        self.n_added += 1
+        return self.size >= self.batch_size and self.n_added % self.update_every == 0
+
+    def sample(self, batch_size=None):
+        # Uniform minibatch, with replacement: (states, actions, rewards, next_states, discounts)
+        idx = self.rng.integers(self.size, size=batch_size or self.batch_size)
+        return self.states[idx], self.actions[idx], self.rewards[idx], self.next_states[idx], self.discounts[idx]
+
+    def clear(self):
+        self.size = 0
+        self.position = 0
+        self.n_added = 0
+
+    def nbytes(self):
+        return (self.states.nbytes + self.actions.nbytes + self.rewards.nbytes + self.next_states.nbytes
+                + self.discounts.nbytes)
@@ -0,0 +1,95 @@
+import html
+import os
+import numpy as np
+
+# Renders training and simulation plots straight to files, for headless runs.
+# matplotlib is imported on first use, and figures are plain Figure objects
+# drawn by the Agg canvas, so no GUI backend or pyplot state is involved and
+# nothing blocks. Long series are downsampled to at most max_points points
+# per line before plotting.
+
+def downsample(x, y, max_points=2000):
+    # Bucket means of x and y, so the line keeps its shape (noise is smoothed,
+    # trends are not) while the cost of drawing stays bounded
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if len(y) <= max_points:
+        return x, y
+    edges = np.linspace(0, len(y), max_points + 1).astype(np.int64)
+    counts = np.diff(edges)
+    return np.add.reduceat(x, edges[:-1]) / counts, np.add.reduceat(y, edges[:-1]) / counts
+
+def _figure():
+    from matplotlib.figure import Figure
+    return Figure(figsize=(12, 6))
+
+def _line_figure(x, y, title, xlabel, ylabel, label=None, color=None, max_points=2000, marker=None):
+    figure = _figure()
+    ax = figure.add_subplot()
+    x, y = downsample(x, y, max_points)
+    ax.plot(x, y, label=label, color=color, marker=marker)
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    if label is not None:
+        ax.legend()
+    return figure
+
+def report_figures(rewards=None, queue_log=None, optimal_checkouts=None, max_points=2000):
+    # {file stem: Figure} for whichever inputs are given. queue_log is a
+    # QueueLog; optimal_checkouts is find_optimal_checkouts() output.
+    figures = {}
+    if rewards is not None and len(rewards):
+        figures['rewards'] = _line_figure(np.arange(len(rewards)), rewards, 'Rewards over Episodes', 'Episode',
+                                          'Total Reward', max_points=max_points)
+    if queue_log is not None and len(queue_log):
+        times = queue_log.times
+        figures['queue_length'] = _line_figure(times, queue_log.average_queue_lengths(),
+                                               'Average Queue Length over Time', 'Time (minutes)',
+                                               'Average Queue Length', label='Average Queue Length',
+                                               max_points=max_points)
+        figures['checkouts'] = _line_figure(times, queue_log.n_checkouts, 'Number of Checkouts over Time',
+                                            'Time (minutes)', 'Number of Checkouts', label='Number of Checkouts',
+                                            color='orange', max_points=max_points)
+    if optimal_checkouts is not None:
+        from src.simulation.customer import get_time_period
+        hours = np.arange(24)
+        checkouts = [optimal_checkouts[(hour, get_time_period(hour * 60))] for hour in hours]
+        figure = _line_figure(hours, checkouts, 'Optimal Number of Checkouts Throughout the Day',
+                              'Hour of the Day', 'Number of Checkouts', marker='o')
+        ax = figure.axes[0]
+        ax.set_xticks(hours)
+        ax.grid(True)
+        figures['optimal_checkouts'] = figure
+    return figures
+
+def write_report(output_dir, rewards=None, queue_log=None, optimal_checkouts=None, max_points=2000,
+                 title='Checkout simulation report', dpi=100):
+    # Saves each figure as <stem>.png and an index.html showing them all, and
+    # returns the paths written
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    sections = []
+    for stem, figure in report_figures(rewards, queue_log, optimal_checkouts, max_points).items():
+        path = os.path.join(output_dir, f'{stem}.png')
+        figure.savefig(path, dpi=dpi)
+        paths.append(path)
+        sections.append(f'<h2>{html.escape(figure.axes[0].get_title())}</h2>\n<img src="{stem}.png">')
+
+    if optimal_checkouts is not None:
+        from src.simulation.customer import get_time_period
+        rows = []
+        for hour in range(24):
+            period = get_time_period(hour * 60)
+            rows.append(f'<tr><td>{hour:02d}:00</td><td>{period.name}</td>'
+                        f'<td>{optimal_checkouts[(hour, period)]}</td></tr>')
+        sections.append('<h2>Optimal checkouts by hour</h2>\n<table>\n'
+                        '<tr><th>Hour</th><th>Time Period</th><th>Checkouts</th></tr>\n'
+                        + '\n'.join(rows) + '\n</table>')
+
+    index_path = os.path.join(output_dir, 'index.html')
+    with open(index_path, 'w') as f:
+        f.write(f'<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>{html.escape(title)}</title></head>\n'
+                f'<body>\n<h1>{html.escape(title)}</h1>\n' + '\n'.join(sections) + '\n</body></html>\n')
+    paths.append(index_path)
+    return paths
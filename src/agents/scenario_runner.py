@@ -0,0 +1,135 @@
+from collections import namedtuple
+import numpy as np
+from src.simulation.customer import TIME_PERIODS, get_arrival_rate
+from src.simulation.environment import SimulationEnvironment
+from src.simulation.vector_environment import VectorSimulationEnvironment
+from src.agents.q_learning_agent import calculate_rewards
+
+# Streams many stores over many days and yields one DailyKPI per store and day
+# as soon as it is computed, so a chain of hundreds of stores never has to be
+# held in memory at once. Each store has its own arrival profile: the
+# customer.py time-of-day rates, scaled by the store's arrival_scale and by a
+# day-of-week multiplier. The customer type mix follows the time of day as well.
+#
+# Days are simulated from open_minute for duration minutes, stores in batches of
+# batch_size through one VectorSimulationEnvironment, or one
+# SimulationEnvironment per store and day with vectorized=False. Both paths keep
+# at least MIN_LANES open, SimulationEnvironment's floor. They differ in one
+# way: when a lane closes, the vector path moves its queue to the remaining
+# lanes, while in SimulationEnvironment those customers finish at the closed
+# lane and stop counting towards the queue lengths. The two paths give
+# comparable KPIs, not identical ones.
+
+MIN_LANES = 3
+
+# Monday first
+DEFAULT_DAY_OF_WEEK_MULTIPLIERS = (0.9, 0.9, 0.95, 1.0, 1.15, 1.3, 1.1)
+
+StoreProfile = namedtuple('StoreProfile', [
+    'store_id',
+    'arrival_scale',           # multiplier on the customer.py arrival rates
+    'lanes',                   # open lanes: an int, or a 24-vector of lanes per hour of day (>= MIN_LANES)
+    'day_of_week_multipliers', # 7 multipliers, Monday first
+], defaults=(1.0, 5, DEFAULT_DAY_OF_WEEK_MULTIPLIERS))
+
+DailyKPI = namedtuple('DailyKPI', [
+    'store_id',
+    'day',
+    'weekday',            # 0 = Monday
+    'customers',          # arrivals during the day
+    'served',             # customers who finished checking out
+    'mean_queue_length',  # per open lane, averaged over the day's minutes
+    'peak_queue_length',  # highest per-lane average seen in any minute
+    'lane_minutes',       # staffing used
+    'cost',               # summed cost_fn over the day's minutes
+])
+
+def arrival_profile(store, weekday):
+    # Per-TimePeriod arrival rates for a store on a weekday, indexed by TimePeriod.value
+    scale = store.arrival_scale * store.day_of_week_multipliers[weekday]
+    return np.array([get_arrival_rate(period) * scale for period in TIME_PERIODS])
+
+def hourly_lanes(store):
+    return np.maximum(np.broadcast_to(np.asarray(store.lanes, dtype=np.int32), (24,)), MIN_LANES)
+
+def run_scenarios(stores, n_days=7, first_weekday=0, duration=1020, open_minute=360, batch_size=256,
+                  seed=0, cost_fn=None, vectorized=True, max_checkouts=16):
+    # Generator of DailyKPI, day by day and within a day in store order.
+    # cost_fn(avg_queue_lengths, n_checkouts) -> cost per minute defaults to the
+    # negated training reward.
+    if cost_fn is None:
+        cost_fn = lambda avg, n: -calculate_rewards(avg, n)
+    stores = list(stores)
+    n_batches = (len(stores) + batch_size - 1) // batch_size
+    day_seeds = np.random.SeedSequence(seed).spawn(n_days)
+
+    envs = {}  # batch size -> environment, reset for every batch and day
+    for day in range(n_days):
+        weekday = (first_weekday + day) % 7
+        batch_seeds = day_seeds[day].spawn(n_batches)
+        for batch_index in range(n_batches):
+            batch = stores[batch_index * batch_size:(batch_index + 1) * batch_size]
+            if vectorized:
+                yield from _run_vector_day(batch, day, weekday, duration, open_minute, batch_seeds[batch_index],
+                                           cost_fn, max_checkouts, envs)
+            else:
+                store_seeds = batch_seeds[batch_index].generate_state(len(batch))
+                for store, store_seed in zip(batch, store_seeds):
+                    yield _run_store_day(store, day, weekday, duration, open_minute, int(store_seed), cost_fn)
+
+def _run_vector_day(stores, day, weekday, duration, open_minute, seed, cost_fn, max_checkouts, envs):
+    # Arrival rates are the base time-of-day tables times a per-store scale
+    scales = np.array([store.arrival_scale * store.day_of_week_multipliers[weekday] for store in stores])
+    lanes = np.array([hourly_lanes(store) for store in stores])
+    first_hour = open_minute // 60
+    env = envs.get(len(stores))
+    if env is None:
+        env = envs[len(stores)] = VectorSimulationEnvironment(len(stores), duration=duration,
+                                                              max_checkouts=max_checkouts, min_checkouts=MIN_LANES,
+                                                              time_of_day=True, start_minute=open_minute)
+    env.arrival_scale = scales
+    env.initial_counters = int(lanes[:, first_hour].min())
+    env.reset(seed)
+
+    mean_queue = np.zeros(len(stores))
+    peak_queue = np.zeros(len(stores))
+    lane_minutes = np.zeros(len(stores), dtype=np.int64)
+    cost = np.zeros(len(stores))
+    for minute in range(duration):
+        if minute == 0 or (open_minute + minute) % 60 == 0:
+            env.set_checkouts(lanes[:, (open_minute + minute) // 60 % 24])
+        env.step()
+        avg = env.get_average_queue_length()
+        mean_queue += avg
+        np.maximum(peak_queue, avg, out=peak_queue)
+        lane_minutes += env.n_checkouts
+        cost += cost_fn(avg, env.n_checkouts)
+    mean_queue /= max(duration, 1)
+
+    for i, store in enumerate(stores):
+        yield DailyKPI(store.store_id, day, weekday, int(env.customer_count[i]), int(env.served_count[i]),
+                       float(mean_queue[i]), float(peak_queue[i]), int(lane_minutes[i]), float(cost[i]))
+
+def _run_store_day(store, day, weekday, duration, open_minute, seed, cost_fn):
+    lanes = hourly_lanes(store)
+    env = SimulationEnvironment(duration=duration, initial_counters=int(lanes[open_minute // 60 % 24]), seed=seed,
+                                arrival_profile=arrival_profile(store, weekday), start_minute=open_minute)
+    while env.current_time < duration:
+        target = int(lanes[(open_minute + env.current_time) // 60 % 24])
+        while len(env.checkouts) < target:
+            env.add_checkout()
+        while len(env.checkouts) > target:
+            env.remove_checkout()
+        env.step()
+
+    avg = env.queue_log.average_queue_lengths()
+    n_checkouts = env.queue_log.n_checkouts
+    return DailyKPI(store.store_id, day, weekday, env.customer_count, env.served_count,
+                    float(avg.mean()), float(avg.max()), int(n_checkouts.sum()),
+                    float(np.sum(cost_fn(avg, n_checkouts))))
+
+def chain_stores(n_stores, lanes=5, scale_range=(0.6, 1.6), seed=0):
+    # n_stores StoreProfiles with arrival scales spread uniformly over scale_range
+    rng = np.random.default_rng(seed)
+    scales = rng.uniform(*scale_range, size=n_stores)
+    return [StoreProfile(f'store-{i:04d}', float(scale), lanes) for i, scale in enumerate(scales)]
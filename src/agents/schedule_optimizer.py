@@ -0,0 +1,117 @@
+from collections import namedtuple
+import numpy as np
+from src.simulation.customer import TimePeriod, get_time_period
+from src.simulation.vector_environment import VectorSimulationEnvironment
+from src.simulation.queueing_model import screen_plans
+from src.agents.q_learning_agent import calculate_rewards
+
+# Scores whole-day staffing plans by simulating them. A plan is a 24-vector of
+# open lanes per hour. All surviving plans are simulated together in one
+# VectorSimulationEnvironment with time-of-day arrivals from customer.py, in
+# rounds of replicas_per_round days. Every plan sees the same replica days
+# (common random numbers), so plans are compared on paired cost differences.
+# After each round, plans whose cost is worse than the current best by more
+# than z standard errors of the paired difference are pruned. With prescreen,
+# plans the queueing model says are overloaded in some hour are pruned before
+# any simulation.
+ScheduleEvaluation = namedtuple('ScheduleEvaluation', [
+    'best_plan',      # the cost-optimal plan (24 ints)
+    'best_index',     # its row in plans
+    'mean_costs',     # mean daily cost per plan over the replicas it was run for
+    'n_replicas',     # replica days each plan was simulated for
+    'pruned',         # True for plans dropped early
+])
+
+def evaluate_schedules(plans, n_replicas=16, replicas_per_round=4, seed=0, cost_fn=None, prune=True, z=3.0,
+                       max_checkouts=16, prescreen=False):
+    # cost_fn(avg_queue_lengths, n_checkouts) -> per-store cost for one minute;
+    # by default the negated training reward, so plans and the agent optimise
+    # the same objective
+    plans = np.asarray(plans, dtype=np.int32)
+    if plans.ndim != 2 or plans.shape[1] != 24:
+        raise ValueError(f"plans must have shape (n_plans, 24), got {plans.shape}")
+    if plans.min() < 1 or plans.max() > max_checkouts:
+        raise ValueError(f"plans must open between 1 and {max_checkouts} lanes every hour")
+    if cost_fn is None:
+        cost_fn = lambda avg, n: -calculate_rewards(avg, n)
+
+    n_plans = len(plans)
+    costs = np.zeros((n_plans, n_replicas))
+    n_run = np.zeros(n_plans, dtype=np.int64)
+    alive = np.ones(n_plans, dtype=bool)
+    if prescreen:
+        feasible = screen_plans(plans)
+        if feasible.any():
+            alive = feasible
+    round_seeds = np.random.SeedSequence(seed).spawn((n_replicas + replicas_per_round - 1) // replicas_per_round)
+    env = None
+
+    for round_index, first_replica in enumerate(range(0, n_replicas, replicas_per_round)):
+        n_round = min(replicas_per_round, n_replicas - first_replica)
+        candidates = np.flatnonzero(alive)
+        # The environment is reset and reused while the round keeps the same shape
+        if env is None or env.n_envs != len(candidates) * n_round or env.n_replicas != n_round:
+            env = plan_environment(len(candidates), n_round, max_checkouts)
+        round_costs = simulate_plans(plans[candidates], n_round, round_seeds[round_index], cost_fn, max_checkouts,
+                                     env)
+        costs[candidates, first_replica:first_replica + n_round] = round_costs
+        n_run[candidates] += n_round
+
+        if prune and len(candidates) > 1 and n_run[candidates[0]] >= 2:
+            alive[candidates] = ~_dominated(costs[candidates, :first_replica + n_round], z)
+
+    mean_costs = np.full(n_plans, np.nan)
+    run = n_run > 0
+    mean_costs[run] = costs[run].sum(axis=1) / n_run[run]
+    survivors = np.flatnonzero(alive)
+    best_index = int(survivors[np.argmin(mean_costs[survivors])])
+    return ScheduleEvaluation(plans[best_index], best_index, mean_costs, n_run, ~alive)
+
+def _dominated(costs, z):
+    # costs: (n_plans, n_replicas) on shared replicas
+    best = np.argmin(costs.mean(axis=1))
+    diffs = costs - costs[best]
+    stderr = diffs.std(axis=1, ddof=1) / np.sqrt(costs.shape[1])
+    return diffs.mean(axis=1) - z * stderr > 0
+
+def plan_environment(n_plans, n_replicas, max_checkouts=16):
+    # Vector environment laid out for simulate_plans: plan-major, with every
+    # plan's stores mapped to replicas 0..n_replicas-1
+    replicas = np.tile(np.arange(n_replicas), n_plans)
+    return VectorSimulationEnvironment(n_plans * n_replicas, duration=24 * 60, initial_counters=1,
+                                       max_checkouts=max_checkouts, min_checkouts=1, time_of_day=True,
+                                       replicas=replicas)
+
+def simulate_plans(plans, n_replicas, seed, cost_fn, max_checkouts=16, env=None):
+    # Returns the (n_plans, n_replicas) total cost of one simulated day per
+    # plan and replica, with every plan run against the same replica days.
+    # env, from plan_environment() with the same shape, is reset and reused.
+    n_plans = len(plans)
+    lanes_by_env = np.repeat(plans, n_replicas, axis=0)
+    if env is None:
+        env = plan_environment(n_plans, n_replicas, max_checkouts)
+    env.initial_counters = int(plans[:, 0].min())
+    env.reset(seed)
+    total_cost = np.zeros(env.n_envs)
+    for minute in range(env.duration):
+        if minute % 60 == 0:
+            env.set_checkouts(lanes_by_env[:, minute // 60])
+        env.step()
+        total_cost += cost_fn(env.get_average_queue_length(), env.n_checkouts)
+    return total_cost.reshape(n_plans, n_replicas)
+
+def plan_from_period_levels(levels):
+    # levels: {TimePeriod: n_lanes} -> 24-vector with each hour's period level
+    return np.array([levels[get_time_period(hour * 60)] for hour in range(24)], dtype=np.int32)
+
+def period_level_plans(min_lanes=3, max_lanes=8, base=None):
+    # Candidate plans that vary one TimePeriod's lane count at a time around
+    # base (a {TimePeriod: n_lanes} dict, default min_lanes everywhere)
+    if base is None:
+        base = dict.fromkeys(TimePeriod, min_lanes)
+    plans = [plan_from_period_levels(base)]
+    for period in TimePeriod:
+        for n_lanes in range(min_lanes, max_lanes + 1):
+            if n_lanes != base[period]:
+                plans.append(plan_from_period_levels({**base, period: n_lanes}))
+    return np.array(plans)
@@ -0,0 +1,45 @@
+import numpy as np
+from src.simulation.customer import TimePeriod
+
+# Maps (average queue length, time period, open checkouts) to a single row
+# index of the dense Q-table. Queue lengths are binned by queue_bin_width and
+# clipped at max_queue_length; checkout counts are clipped to
+# [min_checkouts, max_checkouts].
+class StateEncoder:
+    def __init__(self, max_queue_length=20, queue_bin_width=0.5, min_checkouts=3, max_checkouts=16):
+        self.max_queue_length = max_queue_length
+        self.queue_bin_width = queue_bin_width
+        self.min_checkouts = min_checkouts
+        self.max_checkouts = max_checkouts
+
+        self.n_queue_bins = int(np.ceil(max_queue_length / queue_bin_width)) + 1
+        self.n_periods = len(TimePeriod)
+        self.n_checkout_bins = max_checkouts - min_checkouts + 1
+        self.n_states = self.n_queue_bins * self.n_periods * self.n_checkout_bins
+
+    def encode(self, avg_queue_length, time_period, n_checkouts):
+        queue_bin = min(int(avg_queue_length / self.queue_bin_width), self.n_queue_bins - 1)
+        checkout_bin = min(max(n_checkouts - self.min_checkouts, 0), self.n_checkout_bins - 1)
+        return (queue_bin * self.n_periods + time_period.value) * self.n_checkout_bins + checkout_bin
+
+    def encode_many(self, avg_queue_lengths, period_values, n_checkouts):
+        # Vectorized encode(); period_values holds TimePeriod.value integers
+        queue_bins = np.minimum((np.asarray(avg_queue_lengths) / self.queue_bin_width).astype(np.int64),
+                                self.n_queue_bins - 1)
+        checkout_bins = np.clip(np.asarray(n_checkouts) - self.min_checkouts, 0, self.n_checkout_bins - 1)
+        return (queue_bins * self.n_periods + np.asarray(period_values)) * self.n_checkout_bins + checkout_bins
+
+    def decode(self, state):
+        # Returns the lower edge of the queue bin, the period and the checkout count
+        rest, checkout_bin = divmod(int(state), self.n_checkout_bins)
+        queue_bin, period_value = divmod(rest, self.n_periods)
+        return (queue_bin * self.queue_bin_width, TimePeriod(period_value),
+                checkout_bin + self.min_checkouts)
+
+    def config(self):
+        return {
+            'max_queue_length': self.max_queue_length,
+            'queue_bin_width': self.queue_bin_width,
+            'min_checkouts': self.min_checkouts,
+            'max_checkouts': self.max_checkouts,
+        }
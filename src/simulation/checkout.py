@@ -1,3 +1,4 @@
+import heapq
 import simpy
 
 class Checkout:
@@ -6,16 +7,95 @@ class Checkout:
         self.id = id
         self.queue = simpy.Resource(env, capacity=1)
         self.queue_length = 0  # Add this line
+        self.index = None  # LaneIndex this lane is currently open in, if any
+        self.order = 0  # position in opening order, used to break ties like min() over the lane list
+
+    def reset(self, env, id):
+        # Reuses the lane in a fresh SimPy environment; the Resource is bound to
+        # its environment, so it is the one part that has to be replaced
+        self.env = env
+        self.id = id
+        self.queue = simpy.Resource(env, capacity=1)
+        self.queue_length = 0
+        self.index = None
 
     def get_queue_length(self):
         return self.queue_length  # Change this line
 
     def update_queue_length(self, change):
-        self.queue_length = max(0, self.queue_length + change)  # Add this method
+        old_length = self.queue_length
+        self.queue_length = max(0, old_length + change)  # Add this method
+        if self.index is not None and self.queue_length != old_length:
+            self.index.update(self, self.queue_length - old_length)
+
 
-    
     def is_available(self):
         return self.queue.count == 0
 
     def __str__(self):
-        return f"Checkout {self.id}"
\ No newline at end of file
+        return f"Checkout {self.id}"
+
+
+# Keeps the total number of queued customers over the open lanes and a min-heap
+# of (queue_length, order) entries, so the average is O(1) and the shortest lane
+# is O(log n). Heap entries go stale when a lane's length changes or the lane is
+# closed; they are skipped when they reach the top, and the heap is rebuilt from
+# the open lanes once stale entries outnumber them.
+class LaneIndex:
+    def __init__(self):
+        self.total_queued = 0
+        self._lanes = {}  # order -> Checkout
+        self._heap = []
+        self._pushes = 0  # unique tie-breaker so heap entries never compare Checkouts
+        self._next_order = 0
+
+    def __len__(self):
+        return len(self._lanes)
+
+    def clear(self):
+        for checkout in self._lanes.values():
+            checkout.index = None
+        self.total_queued = 0
+        self._lanes.clear()
+        self._heap.clear()
+        self._pushes = 0
+        self._next_order = 0
+
+    def add(self, checkout):
+        checkout.index = self
+        checkout.order = self._next_order
+        self._next_order += 1
+        self._lanes[checkout.order] = checkout
+        self.total_queued += checkout.queue_length
+        self._push(checkout)
+
+    def remove(self, checkout):
+        del self._lanes[checkout.order]
+        checkout.index = None
+        self.total_queued -= checkout.queue_length
+
+    def update(self, checkout, change):
+        self.total_queued += change
+        self._push(checkout)
+
+    def _push(self, checkout):
+        self._pushes += 1
+        heapq.heappush(self._heap, (checkout.queue_length, checkout.order, self._pushes, checkout))
+        if len(self._heap) > 2 * len(self._lanes) + 32:
+            self._rebuild()
+
+    def _rebuild(self):
+        self._heap = [(checkout.queue_length, order, 0, checkout) for order, checkout in self._lanes.items()]
+        heapq.heapify(self._heap)
+
+    def shortest(self):
+        heap = self._heap
+        while heap:
+            length, _, _, checkout = heap[0]
+            if checkout.index is self and checkout.queue_length == length:
+                return checkout
+            heapq.heappop(heap)
+        return None
+
+    def average(self):
+        return self.total_queued / len(self._lanes) if self._lanes else 0
@@ -0,0 +1,110 @@
+from collections import deque
+import numpy as np
+from .customer import CUSTOMER_TYPES
+
+# Building blocks for SimulationEnvironment(compact=True). Instead of a Customer
+# object, a SimPy process and a Resource request per shopper, a customer is an
+# integer slot in a CustomerPool and lanes serve their queue from a deque of
+# slots, driven by plain timeout callbacks. Slots are recycled once a customer
+# has been served, so memory stays flat however many customers pass through.
+
+TYPE_INDEX = {customer_type: i for i, customer_type in enumerate(CUSTOMER_TYPES)}
+
+class CustomerPool:
+    __slots__ = ('ids', 'types', 'checkout_times', '_free')
+
+    def __init__(self, capacity=256):
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.types = np.zeros(capacity, dtype=np.int8)  # index into CUSTOMER_TYPES
+        self.checkout_times = np.zeros(capacity)
+        self._free = list(range(capacity - 1, -1, -1))
+
+    def __len__(self):
+        # Customers currently in the store
+        return len(self.ids) - len(self._free)
+
+    def allocate(self, customer_id, type_index, checkout_time):
+        if not self._free:
+            self._grow()
+        slot = self._free.pop()
+        self.ids[slot] = customer_id
+        self.types[slot] = type_index
+        self.checkout_times[slot] = checkout_time
+        return slot
+
+    def release(self, slot):
+        self._free.append(slot)
+
+    def clear(self):
+        self._free = list(range(len(self.ids) - 1, -1, -1))
+
+    def _grow(self):
+        capacity = len(self.ids)
+        self.ids = np.concatenate([self.ids, np.zeros(capacity, dtype=self.ids.dtype)])
+        self.types = np.concatenate([self.types, np.zeros(capacity, dtype=self.types.dtype)])
+        self.checkout_times = np.concatenate([self.checkout_times, np.zeros(capacity)])
+        self._free.extend(range(2 * capacity - 1, capacity - 1, -1))
+
+    def nbytes(self):
+        return self.ids.nbytes + self.types.nbytes + self.checkout_times.nbytes
+
+
+# Drop-in for Checkout (same queue_length / LaneIndex interface) that serves
+# one customer at a time from a FIFO of pool slots. on_served(lane, slot) is called
+# when a customer finishes. A lane that has been closed keeps serving whoever
+# is already queued, like a Checkout whose Resource still holds requests.
+class CompactCheckout:
+    __slots__ = ('env', 'id', 'pool', 'on_served', 'queue_length', 'index', 'order', 'waiting', 'busy')
+
+    def __init__(self, env, id, pool, on_served):
+        self.env = env
+        self.id = id
+        self.pool = pool
+        self.on_served = on_served
+        self.queue_length = 0  # waiting plus in service
+        self.index = None
+        self.order = 0
+        self.waiting = deque()
+        self.busy = False
+
+    def reset(self, env, id):
+        self.env = env
+        self.id = id
+        self.queue_length = 0
+        self.index = None
+        self.waiting.clear()
+        self.busy = False
+
+    def get_queue_length(self):
+        return self.queue_length
+
+    def update_queue_length(self, change):
+        old_length = self.queue_length
+        self.queue_length = max(0, old_length + change)
+        if self.index is not None and self.queue_length != old_length:
+            self.index.update(self, self.queue_length - old_length)
+
+    def join(self, slot):
+        self.update_queue_length(1)
+        if self.busy:
+            self.waiting.append(slot)
+        else:
+            self._start_service(slot)
+
+    def _start_service(self, slot):
+        self.busy = True
+        self.env.timeout(float(self.pool.checkout_times[slot]), value=slot).callbacks.append(self._finish_service)
+
+    def _finish_service(self, event):
+        self.update_queue_length(-1)
+        self.on_served(self, event.value)
+        if self.waiting:
+            self._start_service(self.waiting.popleft())
+        else:
+            self.busy = False
+
+    def is_available(self):
+        return not self.busy
+
+    def __str__(self):
+        return f"Checkout {self.id}"
@@ -1,5 +1,7 @@
 from enum import Enum
 import random
+import numpy as np
+from .sim_logging import logger
 
 class CustomerType(Enum):
     QUICK = 1
@@ -14,31 +16,38 @@ class TimePeriod(Enum):
     EVENING = 4
     LATE_EVENING = 5
 
+# (min, max) minutes, drawn uniformly
+SHOPPING_TIME_RANGES = {
+    CustomerType.QUICK: (5, 10),
+    CustomerType.REGULAR: (11, 20),
+    CustomerType.LENGTHY: (21, 40),
+}
+
+CHECKOUT_TIME_RANGES = {
+    CustomerType.QUICK: (1, 2),
+    CustomerType.REGULAR: (3, 5),
+    CustomerType.LENGTHY: (5, 7),
+}
+
 class Customer:
+    __slots__ = ('name', 'type')
+
     def __init__(self, name, customer_type):
         self.name = name
         self.type = customer_type
 
-    def shopping_time(self):
-        if self.type == CustomerType.QUICK:
-            return random.uniform(5, 10)
-        elif self.type == CustomerType.REGULAR:
-            return random.uniform(11, 20)
-        elif self.type == CustomerType.LENGTHY:
-            return random.uniform(21, 40)
-
-    def checkout_time(self):
-        if self.type == CustomerType.QUICK:
-            return random.uniform(1, 2)
-        elif self.type == CustomerType.REGULAR:
-            return random.uniform(3, 5)
-        elif self.type == CustomerType.LENGTHY:
-            return random.uniform(5, 7)
+    # rng is anything with a random-module style uniform(), e.g. a BatchedRandom stream
+    def shopping_time(self, rng=random):
+        return rng.uniform(*SHOPPING_TIME_RANGES[self.type])
+
+    def checkout_time(self, rng=random):
+        return rng.uniform(*CHECKOUT_TIME_RANGES[self.type])
         
         
 
-def get_time_period(current_time):
-    hours = (current_time // 60) % 24  # Convert minutes to hours
+MINUTES_PER_DAY = 24 * 60
+
+def _time_period_for_hour(hours):
     if 6 <= hours < 9:
         return TimePeriod.EARLY_MORNING
     elif 9 <= hours < 12:
@@ -54,60 +63,130 @@ def get_time_period(current_time):
     else:
         return TimePeriod.EARLY_MORNING  # From 23:00 to 06:00, consider it early morning of the next day
 
-print("Time periods:")
-for hour in range(24):
-    period = get_time_period(hour * 60)
-    print(f"{hour:02d}:00 - {period.name}")
+TIME_PERIODS = list(TimePeriod)
+CUSTOMER_TYPES = list(CustomerType)
+
+# Minute of day -> TimePeriod.value, and the same as a list of members for
+# scalar lookups (indexing a list is cheaper than indexing an ndarray)
+PERIOD_INDEX_BY_MINUTE = np.array([_time_period_for_hour(minute // 60).value for minute in range(MINUTES_PER_DAY)],
+                                  dtype=np.int8)
+_PERIOD_BY_MINUTE = [TIME_PERIODS[i] for i in PERIOD_INDEX_BY_MINUTE]
+
+def _minutes_until_period_change(period_index_by_minute):
+    minutes_until_change = np.zeros(MINUTES_PER_DAY, dtype=np.int32)
+    remaining = 1
+    for minute in range(2 * MINUTES_PER_DAY - 1, -1, -1):  # two passes to carry across midnight
+        i = minute % MINUTES_PER_DAY
+        next_minute = (i + 1) % MINUTES_PER_DAY
+        remaining = 1 if period_index_by_minute[next_minute] != period_index_by_minute[i] else remaining + 1
+        minutes_until_change[i] = remaining
+    return minutes_until_change
+
+# Minute of day -> minutes until the time period next changes
+MINUTES_UNTIL_PERIOD_CHANGE = _minutes_until_period_change(PERIOD_INDEX_BY_MINUTE)
+
+def get_time_period(current_time):
+    return _PERIOD_BY_MINUTE[int(current_time) % MINUTES_PER_DAY]
+
+def print_time_periods():
+    print("Time periods:")
+    for hour in range(24):
+        period = get_time_period(hour * 60)
+        print(f"{hour:02d}:00 - {period.name}")
+
+ARRIVAL_RATES = {
+    TimePeriod.EARLY_MORNING: 1/1.5,  # 1 customer every 1.5 minutes
+    TimePeriod.MORNING: 1/1,          # 1 customer every minute
+    TimePeriod.LUNCH: 1/0.5,          # 2 customers every minute
+    TimePeriod.AFTERNOON: 1/0.75,        # 1 customer every minute
+    TimePeriod.EVENING: 1/1,       
+    TimePeriod.LATE_EVENING: 1/2      # 1 customer every 2 minutes
+}
+
+CUSTOMER_TYPE_PROBABILITIES = {
+    TimePeriod.EARLY_MORNING: [0.5, 0.4, 0.1],  # [QUICK, REGULAR, LENGTHY]
+    TimePeriod.MORNING: [0.4, 0.4, 0.2],
+    TimePeriod.LUNCH: [0.7, 0.2, 0.1],
+    TimePeriod.AFTERNOON: [0.3, 0.4, 0.3],
+    TimePeriod.EVENING: [0.3, 0.5, 0.2],
+    TimePeriod.LATE_EVENING: [0.8, 0.2, 0]
+}
+
+# Indexed by TimePeriod.value
+ARRIVAL_RATE_TABLE = np.array([ARRIVAL_RATES[period] for period in TIME_PERIODS])
+CUSTOMER_TYPE_PROBABILITY_TABLE = np.array([CUSTOMER_TYPE_PROBABILITIES[period] for period in TIME_PERIODS])
+
 def get_arrival_rate(time_period):
-    rates = {
-        TimePeriod.EARLY_MORNING: 1/1.5,  # 1 customer every 1.5 minutes
-        TimePeriod.MORNING: 1/1,          # 1 customer every minute
-        TimePeriod.LUNCH: 1/0.5,          # 2 customers every minute
-        TimePeriod.AFTERNOON: 1/0.75,        # 1 customer every minute
-        TimePeriod.EVENING: 1/1,       
-        TimePeriod.LATE_EVENING: 1/2      # 1 customer every 2 minutes
-    }
-    return rates[time_period]
+    return ARRIVAL_RATES[time_period]
 
 def get_customer_type_probabilities(time_period):
-    probabilities = {
-        TimePeriod.EARLY_MORNING: [0.5, 0.4, 0.1],  # [QUICK, REGULAR, LENGTHY]
-        TimePeriod.MORNING: [0.4, 0.4, 0.2],
-        TimePeriod.LUNCH: [0.7, 0.2, 0.1],
-        TimePeriod.AFTERNOON: [0.3, 0.4, 0.3],
-        TimePeriod.EVENING: [0.3, 0.5, 0.2],
-        TimePeriod.LATE_EVENING: [0.8, 0.2, 0]
-    }
-    return probabilities[time_period]
-
-def customer_process(env, customer, checkouts, stats_updater):
+    return CUSTOMER_TYPE_PROBABILITIES[time_period]
+
+# Hands out customer types from pre-drawn blocks, one Generator.choice call per
+# block_size customers. Each row of probability_table is an independent
+# distribution (by default one per TimePeriod.value). The default generator is
+# seeded from the global random state, so random.seed() still reproduces a run.
+class CustomerTypeSampler:
+    def __init__(self, probability_table=CUSTOMER_TYPE_PROBABILITY_TABLE, rng=None, block_size=1024):
+        self.probability_table = np.asarray(probability_table, dtype=float)
+        self.rng = rng if rng is not None else np.random.default_rng(random.getrandbits(64))
+        self.block_size = block_size
+        self._blocks = [None] * len(self.probability_table)
+        self._positions = [block_size] * len(self.probability_table)
+
+    def reset(self, rng):
+        # Discards the drawn blocks and continues from rng
+        self.rng = rng
+        self._positions = [self.block_size] * len(self.probability_table)
+
+    def sample(self, row=0):
+        position = self._positions[row]
+        if position == self.block_size:
+            self._blocks[row] = self.rng.choice(len(CUSTOMER_TYPES), size=self.block_size,
+                                                p=self.probability_table[row]).tolist()
+            position = 0
+        self._positions[row] = position + 1
+        return CUSTOMER_TYPES[self._blocks[row][position]]
+
+def customer_process(env, customer, checkouts, stats_updater, events=None):
     stats_updater(customer, env.now)  # Update statistics when customer arrives
+    if events is not None:
+        events.emit('arrival', env.now, customer=customer.name, type=customer.type.name)
     shopping_time = customer.shopping_time()
     yield env.timeout(shopping_time)
     
     # Choose the checkout with the shortest queue
     chosen_checkout = min(checkouts, key=lambda x: x.get_queue_length())
+    if events is not None:
+        events.emit('queue_join', env.now, customer=customer.name, checkout=chosen_checkout.id)
     
     with chosen_checkout.queue.request() as request:
         yield request
         checkout_time = customer.checkout_time()
         yield env.timeout(checkout_time)
-    print(f"Customer {customer.name} joined queue of Checkout {chosen_checkout.id} at time {env.now}")
+    logger.debug("Customer %s joined queue of Checkout %s at time %s", customer.name, chosen_checkout.id, env.now)
+    if events is not None:
+        events.emit('service_complete', env.now, customer=customer.name, checkout=chosen_checkout.id)
 
 
-def customer_generator(env, checkouts, stats_updater):
+def customer_generator(env, checkouts, stats_updater, events=None, type_sampler=None):
+    if type_sampler is None:
+        type_sampler = CustomerTypeSampler()
     i = 0
     while True:
         current_time = env.now
         time_period = get_time_period(current_time)
-        arrival_rate = get_arrival_rate(time_period)
-        customer_type_probabilities = get_customer_type_probabilities(time_period)
+        arrival_rate = ARRIVAL_RATES[time_period]
 
         inter_arrival_time = random.expovariate(arrival_rate)
         yield env.timeout(inter_arrival_time)
 
         i += 1
-        customer_type = random.choices(list(CustomerType), weights=customer_type_probabilities)[0]
+        customer_type = type_sampler.sample(time_period.value)
         customer = Customer(f'Customer {i}', customer_type)
         
-        env.process(customer_process(env, customer, checkouts, stats_updater))
\ No newline at end of file
+        env.process(customer_process(env, customer, checkouts, stats_updater, events))
+
+
+if __name__ == "__main__":
+    print_time_periods()
@@ -1,23 +1,91 @@
 # In environment.py
 
+import math
 import simpy
 from collections import Counter
-from statistics import mean
-from .customer import customer_generator, get_time_period, TimePeriod, Customer, CustomerType
-from .checkout import Checkout
-import random
+from .customer import (customer_generator, get_time_period, TimePeriod, Customer, CustomerType,
+                       CustomerTypeSampler, MINUTES_PER_DAY, MINUTES_UNTIL_PERIOD_CHANGE,
+                       CUSTOMER_TYPE_PROBABILITY_TABLE, SHOPPING_TIME_RANGES, CHECKOUT_TIME_RANGES)
+from .checkout import Checkout, LaneIndex
+from .compact import CustomerPool, CompactCheckout, TYPE_INDEX
+from .queue_log import QueueLog
+from .sim_logging import logger
+from .rng import RandomStreams
+
+DEFAULT_ARRIVAL_RATE = 1/5  # customers per minute
 
 class SimulationEnvironment:
-    def __init__(self, duration=1020, initial_counters=5):
-        self.env = simpy.Environment()
+    def __init__(self, duration=1020, initial_counters=5, queue_log_retention=None, queue_log_sink=None,
+                 events=None, seed=None, arrival_rate=DEFAULT_ARRIVAL_RATE, arrival_profile=None, start_minute=0,
+                 compact=False):
         self.duration = duration
-        self.checkouts = [Checkout(self.env, i) for i in range(initial_counters)]
+        # compact: customers are recycled integer slots in a CustomerPool and lanes
+        # are CompactCheckouts, with no SimPy process or Resource per customer.
+        # Customer events then carry integer ids instead of names.
+        self.compact = compact
+        self.customer_pool = CustomerPool() if compact else None
+        self.checkouts = []
+        self._closed_checkouts = []  # removed lanes, reused by reset()
+        self.lane_index = LaneIndex()
         self.customer_types = Counter()
         self.time_period_stats = {period: Counter() for period in TimePeriod}
-        self.queue_log = []
-        self.current_time = 0
+        # With a sink, the log is flushed in chunks of one episode's length;
+        # reset() and close() flush whatever is left of a run
+        self.queue_log = QueueLog(capacity=duration, retention=queue_log_retention, sink=queue_log_sink)
         self.initial_counters = initial_counters
+        self.arrival_rate = arrival_rate  # customers per minute
+        # Optional per-TimePeriod arrival rates, indexed by TimePeriod.value. When
+        # given, arrivals and the customer type mix follow the time of day
+        # (simulation time 0 is minute start_minute of the day) instead of the
+        # flat arrival_rate with equally likely types.
+        self.arrival_profile = None if arrival_profile is None else [float(rate) for rate in arrival_profile]
+        self.start_minute = start_minute
+        self.events = events  # optional EventStream for per-customer events
+        if self.arrival_profile is None:
+            # A single row of equal weights: every customer type is equally likely
+            self._type_probabilities = [[1 / len(CustomerType)] * len(CustomerType)]
+        else:
+            self._type_probabilities = CUSTOMER_TYPE_PROBABILITY_TABLE
+        self.type_sampler = None
+        self.reset(seed)
+
+    def reset(self, seed=None):
+        # Back to time 0 with initial_counters empty lanes and the random
+        # streams of seed, reusing the lane objects, counters and log buffers.
+        # A reset environment runs exactly like a new one built with that seed.
+        # Only the SimPy environment itself is replaced, which drops every
+        # pending event and customer process of the previous run.
+        self.env = simpy.Environment()
+        lanes = self.checkouts + self._closed_checkouts
+        self.checkouts = []
+        self._closed_checkouts = []
+        self.lane_index.clear()
+        if self.customer_pool is not None:
+            self.customer_pool.clear()
+        for i in range(self.initial_counters):
+            if i < len(lanes):
+                lanes[i].reset(self.env, i)
+                checkout = lanes[i]
+            else:
+                checkout = self._new_checkout(i)
+            self.checkouts.append(checkout)
+            self.lane_index.add(checkout)
+
+        self.customer_types.clear()
+        for stats in self.time_period_stats.values():
+            stats.clear()
+        if self.queue_log.sink is not None:
+            self.queue_log.flush()  # the previous run's last partial chunk
+        self.queue_log.clear()
+        self.current_time = 0
         self.customer_count = 0
+        self.served_count = 0
+        self.rng = RandomStreams(seed)
+        if self.type_sampler is None:
+            self.type_sampler = CustomerTypeSampler(self._type_probabilities,
+                                                    rng=self.rng.generators['customer_types'])
+        else:
+            self.type_sampler.reset(self.rng.generators['customer_types'])
 
         # Start the customer generator process
         self.env.process(self.customer_generator_process())
@@ -28,67 +96,158 @@ class SimulationEnvironment:
         self.current_time += 1
         self.update_queue_lengths()
 
+    def skip_idle_minutes(self, max_minutes):
+        # Jump over whole minutes in which no SimPy event fires. Queue lengths
+        # cannot change during them, so they are logged in bulk with the
+        # current state. Returns the number of minutes skipped.
+        # run(until=...) leaves its spent stop event at the current instant, and
+        # anything else due right now would be processed first by the next run
+        # anyway, so drain those before looking at what comes next.
+        while self.env.peek() <= self.env.now:
+            self.env.step()
+        next_event = self.env.peek()
+        idle = max_minutes if next_event == math.inf else min(int(next_event) - self.current_time, max_minutes)
+        if idle <= 0:
+            return 0
+
+        self.env.run(until=self.current_time + idle)
+        queue_lengths = [checkout.get_queue_length() for checkout in self.checkouts]
+        self.queue_log.record_many(self.current_time + 1, idle, queue_lengths, len(self.checkouts))
+        self.current_time += idle
+        return idle
+
+    def minutes_until_decision(self):
+        # The agent has to be consulted again when the time period changes or
+        # when the episode ends
+        period_change = int(MINUTES_UNTIL_PERIOD_CHANGE[(self.start_minute + self.current_time) % MINUTES_PER_DAY])
+        return min(period_change, self.duration - self.current_time)
+
     def customer_generator_process(self):
         while True:
-            yield self.env.timeout(random.expovariate(1/5))  # Generate a customer every 5 minutes on average
+            if self.arrival_profile is None:
+                arrival_rate, row = self.arrival_rate, 0
+            else:
+                # Rate of the period the gap starts in, like customer_generator
+                row = get_time_period(self.start_minute + self.env.now).value
+                arrival_rate = self.arrival_profile[row]
+            yield self.env.timeout(self.rng.arrivals.expovariate(arrival_rate))  # Generate a customer every 5 minutes on average by default
             self.customer_count += 1
-            customer = Customer(f'Customer {self.customer_count}', random.choice(list(CustomerType)))
+            if self.compact:
+                self._compact_arrival(self.type_sampler.sample(row))
+                continue
+            customer = Customer(f'Customer {self.customer_count}', self.type_sampler.sample(row))
             #print(f"Generated {customer.name} at time {self.env.now}")
+            if self.events is not None:
+                self.events.emit('arrival', self.env.now, customer=customer.name, type=customer.type.name)
             self.env.process(self.customer_process(customer))
 
     def customer_process(self, customer):
         #print(f"Processing {customer.name} at time {self.env.now}")
-        shopping_time = customer.shopping_time()
+        # Both times are drawn on arrival, in arrival order, so a customer's
+        # service needs do not depend on how the queues played out
+        shopping_time = customer.shopping_time(self.rng.service_times)
+        checkout_time = customer.checkout_time(self.rng.service_times)
         yield self.env.timeout(shopping_time)
         
-        chosen_checkout = min(self.checkouts, key=lambda x: x.get_queue_length())
+        chosen_checkout = self.lane_index.shortest()
         #print(f"{customer.name} choosing checkout {chosen_checkout.id} at time {self.env.now}")
         
         chosen_checkout.update_queue_length(1)  # Increment queue length
+        if self.events is not None:
+            self.events.emit('queue_join', self.env.now, customer=customer.name, checkout=chosen_checkout.id,
+                             queue_length=chosen_checkout.get_queue_length())
         #print(f"Queue length for checkout {chosen_checkout.id} is now {chosen_checkout.get_queue_length()}")
         
         with chosen_checkout.queue.request() as request:
             yield request
             #print(f"{customer.name} started checkout at {chosen_checkout.id} at time {self.env.now}")
-            checkout_time = customer.checkout_time()
             yield self.env.timeout(checkout_time)
         
         chosen_checkout.update_queue_length(-1)  # Decrement queue length
+        self.served_count += 1
+        if self.events is not None:
+            self.events.emit('service_complete', self.env.now, customer=customer.name, checkout=chosen_checkout.id)
         #print(f"{customer.name} finished checkout at time {self.env.now}")
         #print(f"Queue length for checkout {chosen_checkout.id} is now {chosen_checkout.get_queue_length()}")
 
+    def _compact_arrival(self, customer_type):
+        # Same draws in the same order as customer_process, but the shopping trip
+        # is a bare timeout whose callback puts the customer in a lane
+        shopping_time = self.rng.service_times.uniform(*SHOPPING_TIME_RANGES[customer_type])
+        checkout_time = self.rng.service_times.uniform(*CHECKOUT_TIME_RANGES[customer_type])
+        slot = self.customer_pool.allocate(self.customer_count, TYPE_INDEX[customer_type], checkout_time)
+        if self.events is not None:
+            self.events.emit('arrival', self.env.now, customer=self.customer_count, type=customer_type.name)
+        self.env.timeout(shopping_time, value=slot).callbacks.append(self._compact_join)
+
+    def _compact_join(self, event):
+        chosen_checkout = self.lane_index.shortest()
+        chosen_checkout.join(event.value)
+        if self.events is not None:
+            self.events.emit('queue_join', self.env.now, customer=int(self.customer_pool.ids[event.value]),
+                             checkout=chosen_checkout.id, queue_length=chosen_checkout.get_queue_length())
+
+    def _compact_served(self, checkout, slot):
+        self.served_count += 1
+        if self.events is not None:
+            self.events.emit('service_complete', self.env.now, customer=int(self.customer_pool.ids[slot]),
+                             checkout=checkout.id)
+        self.customer_pool.release(slot)
+
+    def _new_checkout(self, id):
+        if self.compact:
+            return CompactCheckout(self.env, id, self.customer_pool, self._compact_served)
+        return Checkout(self.env, id)
+
     def update_queue_lengths(self):
         queue_lengths = [checkout.get_queue_length() for checkout in self.checkouts]
         #print(f"Current time: {self.current_time}, Queue lengths: {queue_lengths}")
         #print(f"Total customers generated: {self.customer_count}")
-        self.queue_log.append((self.current_time, queue_lengths, len(self.checkouts)))
+        self.queue_log.record(self.current_time, queue_lengths, len(self.checkouts))
 
     def get_average_queue_length(self):
-        queue_lengths = [checkout.get_queue_length() for checkout in self.checkouts]
-        avg_length = mean(queue_lengths) if queue_lengths else 0
+        avg_length = self.lane_index.average()
         #print(f"Average queue length: {avg_length}")
         return avg_length
 
     def add_checkout(self):
-        new_checkout = Checkout(self.env, len(self.checkouts))
+        new_checkout = self._new_checkout(len(self.checkouts))
         self.checkouts.append(new_checkout)
+        self.lane_index.add(new_checkout)
         #print(f"Added new checkout. Total checkouts: {len(self.checkouts)}")
 
     def remove_checkout(self):
         if len(self.checkouts) > 3:  # Ensure at least 3 checkouts remain open
-            checkout_to_remove = min(self.checkouts, key=lambda x: x.get_queue_length())
+            checkout_to_remove = self.lane_index.shortest()
             self.checkouts.remove(checkout_to_remove)
+            self.lane_index.remove(checkout_to_remove)
+            if len(self.checkouts) + len(self._closed_checkouts) < self.initial_counters:
+                self._closed_checkouts.append(checkout_to_remove)
             #print(f"Removed a checkout. Total checkouts: {len(self.checkouts)}")
 
     def get_current_time_period(self):
-        return get_time_period(self.current_time)
+        return get_time_period(self.start_minute + self.current_time)
 
     def run(self):
-        print("Starting simulation")
+        logger.info("Starting simulation")
         self.env.run(until=self.duration)
-        print("Simulation completed")
+        logger.info("Simulation completed")
+        self.close()
         self.print_statistics()
 
+    def close(self):
+        # Hands the queue log's last partial chunk to its sink. Without this the
+        # rows since the last full chunk are never written: with the default
+        # capacity of one duration, a single run would write nothing at all.
+        if self.queue_log.sink is not None:
+            self.queue_log.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
     def print_statistics(self):
         print("\nOverall customer type statistics:")
         for customer_type, count in self.customer_types.items():
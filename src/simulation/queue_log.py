@@ -0,0 +1,182 @@
+import os
+import numpy as np
+
+# Columnar per-minute record of the checkout queues: one row per logged minute
+# with the time, each lane's queue length (zero-padded to max_checkouts columns,
+# lanes in list order) and the number of open checkouts.
+#
+# By default the buffers grow as needed. With retention set, only the latest
+# `retention` rows are kept in a ring buffer. With a sink, every full chunk of
+# `capacity` rows is handed to the sink and dropped from memory. The last,
+# partial chunk is only written by flush(), which the owner has to call when
+# it is done recording (SimulationEnvironment.close() does).
+class QueueLog:
+    def __init__(self, capacity=1024, max_checkouts=16, retention=None, sink=None):
+        if retention is not None:
+            capacity = retention
+        self.retention = retention
+        self.sink = sink
+        self._times = np.zeros(capacity, dtype=np.int64)
+        self._queue_lengths = np.zeros((capacity, max_checkouts), dtype=np.int32)
+        self._n_checkouts = np.zeros(capacity, dtype=np.int32)
+        self._size = 0
+        self._start = 0  # index of the oldest row once the ring buffer has wrapped
+        self.total_recorded = 0
+
+    def record(self, time, queue_lengths, n_checkouts):
+        row = self._next_row()
+        n_lanes = len(queue_lengths)
+        if n_lanes > self._queue_lengths.shape[1]:
+            self._widen(n_lanes)
+        self._times[row] = time
+        self._queue_lengths[row, :n_lanes] = queue_lengths
+        self._queue_lengths[row, n_lanes:] = 0
+        self._n_checkouts[row] = n_checkouts
+
+    def record_many(self, first_time, count, queue_lengths, n_checkouts):
+        # count consecutive minutes starting at first_time with the same state
+        n_lanes = len(queue_lengths)
+        if n_lanes > self._queue_lengths.shape[1]:
+            self._widen(n_lanes)
+        while count:
+            free = len(self._times) - self._size
+            if free == 0 or self._start:
+                # Full buffer: let record() wrap, flush or grow
+                self.record(first_time, queue_lengths, n_checkouts)
+                first_time += 1
+                count -= 1
+                continue
+            n = min(count, free)
+            rows = slice(self._size, self._size + n)
+            self._times[rows] = np.arange(first_time, first_time + n)
+            self._queue_lengths[rows, :n_lanes] = queue_lengths
+            self._queue_lengths[rows, n_lanes:] = 0
+            self._n_checkouts[rows] = n_checkouts
+            self._size += n
+            self.total_recorded += n
+            first_time += n
+            count -= n
+
+    def _next_row(self):
+        capacity = len(self._times)
+        self.total_recorded += 1
+        if self._size < capacity:
+            self._size += 1
+            return self._size - 1
+        if self.retention is not None:
+            row = self._start
+            self._start = (self._start + 1) % capacity
+            return row
+        if self.sink is not None:
+            self.flush()
+            self._size = 1
+            return 0
+        self._grow(capacity * 2)
+        self._size += 1
+        return self._size - 1
+
+    def _grow(self, capacity):
+        self._times = np.resize(self._times, capacity)
+        queue_lengths = np.zeros((capacity, self._queue_lengths.shape[1]), dtype=self._queue_lengths.dtype)
+        queue_lengths[:self._size] = self._queue_lengths[:self._size]
+        self._queue_lengths = queue_lengths
+        self._n_checkouts = np.resize(self._n_checkouts, capacity)
+
+    def _widen(self, n_lanes):
+        width = max(n_lanes, 2 * self._queue_lengths.shape[1])
+        queue_lengths = np.zeros((len(self._times), width), dtype=self._queue_lengths.dtype)
+        queue_lengths[:, :self._queue_lengths.shape[1]] = self._queue_lengths
+        self._queue_lengths = queue_lengths
+
+    def _column(self, data):
+        # Views while the ring buffer has not wrapped, a reordered copy after
+        if self._start == 0:
+            return data[:self._size]
+        return np.concatenate((data[self._start:], data[:self._start]))
+
+    @property
+    def times(self):
+        return self._column(self._times)
+
+    @property
+    def queue_lengths(self):
+        return self._column(self._queue_lengths)
+
+    @property
+    def n_checkouts(self):
+        return self._column(self._n_checkouts)
+
+    def average_queue_lengths(self):
+        n_checkouts = self.n_checkouts
+        totals = self.queue_lengths.sum(axis=1)
+        return np.divide(totals, n_checkouts, out=np.zeros(len(totals)), where=n_checkouts > 0)
+
+    def flush(self):
+        if self.sink is not None and self._size:
+            self.sink.write(self.times, self.queue_lengths, self.n_checkouts)
+        self._size = 0
+        self._start = 0
+
+    def clear(self):
+        self._size = 0
+        self._start = 0
+        self.total_recorded = 0
+
+    @property
+    def nbytes(self):
+        return self._times.nbytes + self._queue_lengths.nbytes + self._n_checkouts.nbytes
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        # (time, queue_lengths, n_checkouts) rows, like the old list-of-tuples log
+        for time, queue_lengths, n_checkouts in zip(self.times, self.queue_lengths, self.n_checkouts):
+            yield int(time), queue_lengths[:n_checkouts].tolist(), int(n_checkouts)
+
+
+# Writes each chunk to <directory>/<prefix>_<n>.npz
+class NpzSink:
+    def __init__(self, directory, prefix='queue_log'):
+        self.directory = directory
+        self.prefix = prefix
+        self.n_chunks = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, times, queue_lengths, n_checkouts):
+        path = os.path.join(self.directory, f'{self.prefix}_{self.n_chunks:05d}.npz')
+        np.savez(path, times=times, queue_lengths=queue_lengths, n_checkouts=n_checkouts)
+        self.n_chunks += 1
+
+
+# Writes each chunk to <directory>/<prefix>_<n>.parquet with one column per lane.
+# Needs pyarrow, which is not a dependency of the simulation itself.
+class ParquetSink:
+    def __init__(self, directory, prefix='queue_log'):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise ImportError("ParquetSink requires pyarrow (pip install pyarrow)") from e
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self.directory = directory
+        self.prefix = prefix
+        self.n_chunks = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, times, queue_lengths, n_checkouts):
+        columns = {'time': times, 'n_checkouts': n_checkouts}
+        for lane in range(queue_lengths.shape[1]):
+            columns[f'queue_length_{lane}'] = queue_lengths[:, lane]
+        path = os.path.join(self.directory, f'{self.prefix}_{self.n_chunks:05d}.parquet')
+        self._pq.write_table(self._pa.table(columns), path)
+        self.n_chunks += 1
+
+
+def read_npz_chunks(directory, prefix='queue_log'):
+    # Yields (times, queue_lengths, n_checkouts) for each chunk written by NpzSink
+    for name in sorted(os.listdir(directory)):
+        if name.startswith(prefix + '_') and name.endswith('.npz'):
+            with np.load(os.path.join(directory, name)) as chunk:
+                yield chunk['times'], chunk['queue_lengths'], chunk['n_checkouts']
@@ -0,0 +1,114 @@
+from collections import namedtuple
+import math
+import numpy as np
+from .customer import (TimePeriod, CustomerType, CHECKOUT_TIME_RANGES, ARRIVAL_RATES, CUSTOMER_TYPE_PROBABILITIES,
+                       CUSTOMER_TYPE_PROBABILITY_TABLE, get_time_period)
+
+# Closed-form M/G/c estimates of the checkout queues: Erlang C for the
+# probability of waiting, with the Allen-Cunneen correction for non-exponential
+# service times. Arrivals at the checkouts are Poisson (shopping times only
+# delay a Poisson stream), and service times are the customer-type mixture of
+# the CHECKOUT_TIME_RANGES uniforms. Lanes are treated as one pooled queue,
+# which is close to join-the-shortest-queue when lanes are balanced.
+#
+# expected_queue_per_lane counts customers in service too, like
+# Checkout.queue_length, so it is directly comparable with
+# SimulationEnvironment.get_average_queue_length().
+QueueEstimate = namedtuple('QueueEstimate', [
+    'utilization',              # arrival_rate / (n_checkouts * service_rate)
+    'prob_wait',                # Erlang C probability an arrival has to wait
+    'expected_wait',            # minutes spent waiting before service
+    'expected_waiting',         # customers waiting, not yet in service
+    'expected_in_system',       # waiting plus in service
+    'expected_queue_per_lane',  # expected_in_system / n_checkouts
+])
+
+UNSTABLE = QueueEstimate(math.inf, 1.0, math.inf, math.inf, math.inf, math.inf)
+
+def service_time_moments(type_probabilities):
+    # Mean and squared coefficient of variation of the mixed service time
+    mean = second_moment = 0.0
+    for customer_type, p in zip(CustomerType, type_probabilities):
+        a, b = CHECKOUT_TIME_RANGES[customer_type]
+        mean += p * (a + b) / 2
+        second_moment += p * (a * a + a * b + b * b) / 3
+    return mean, second_moment / (mean * mean) - 1
+
+def erlang_c(n_servers, offered_load):
+    # Probability of waiting in M/M/c, via the numerically stable Erlang B recursion
+    if offered_load >= n_servers:
+        return 1.0
+    erlang_b = 1.0
+    for k in range(1, n_servers + 1):
+        erlang_b = offered_load * erlang_b / (k + offered_load * erlang_b)
+    return erlang_b / (1 - offered_load / n_servers * (1 - erlang_b))
+
+def estimate_queue(arrival_rate, n_checkouts, mean_service_time, service_scv):
+    offered_load = arrival_rate * mean_service_time
+    if n_checkouts <= 0 or offered_load >= n_checkouts:
+        return UNSTABLE
+    prob_wait = erlang_c(n_checkouts, offered_load)
+    service_rate = 1 / mean_service_time
+    expected_wait = prob_wait / (n_checkouts * service_rate - arrival_rate) * (1 + service_scv) / 2
+    expected_waiting = arrival_rate * expected_wait
+    expected_in_system = expected_waiting + offered_load
+    return QueueEstimate(offered_load / n_checkouts, prob_wait, expected_wait, expected_waiting,
+                         expected_in_system, expected_in_system / n_checkouts)
+
+def estimate_period(time_period, n_checkouts, arrival_rate=None, type_probabilities=None):
+    # Steady-state estimate for a TimePeriod; the rate and type mix default to
+    # the customer.py tables for that period
+    if arrival_rate is None:
+        arrival_rate = ARRIVAL_RATES[time_period]
+    if type_probabilities is None:
+        type_probabilities = CUSTOMER_TYPE_PROBABILITIES[time_period]
+    mean, scv = service_time_moments(type_probabilities)
+    return estimate_queue(arrival_rate, n_checkouts, mean, scv)
+
+def min_checkouts(time_period, max_queue_per_lane=2.5, max_wait=None, max_checkouts=40):
+    # Smallest lane count whose estimate meets the targets, or None
+    for n_checkouts in range(1, max_checkouts + 1):
+        estimate = estimate_period(time_period, n_checkouts)
+        if estimate.expected_queue_per_lane <= max_queue_per_lane and (
+                max_wait is None or estimate.expected_wait <= max_wait):
+            return n_checkouts
+    return None
+
+def screen_plans(plans, max_utilization=0.95):
+    # True for hourly plans (n_plans, 24) that keep every hour below
+    # max_utilization, i.e. are not hopelessly understaffed at some point
+    plans = np.atleast_2d(plans)
+    lowest_ok = {}
+    for period in TimePeriod:
+        mean, _ = service_time_moments(CUSTOMER_TYPE_PROBABILITIES[period])
+        lowest_ok[period] = ARRIVAL_RATES[period] * mean / max_utilization
+    needed = np.array([lowest_ok[get_time_period(hour * 60)] for hour in range(24)])
+    return (plans >= needed).all(axis=1)
+
+def compare_with_simulation(env):
+    # Per TimePeriod seen in env.queue_log: (simulated mean queue per lane,
+    # surrogate estimate for the same lane counts). Uses the environment's
+    # arrival_profile with the customer.py type mix of each period when it has
+    # one, otherwise its flat arrival rate with equally likely customer types.
+    times = env.queue_log.times
+    simulated = env.queue_log.average_queue_lengths()
+    n_checkouts = env.queue_log.n_checkouts
+    periods = np.array([get_time_period(env.start_minute + t).value for t in times])
+
+    comparison = {}
+    for period in TimePeriod:
+        in_period = periods == period.value
+        if not in_period.any():
+            continue
+        if env.arrival_profile is None:
+            arrival_rate = env.arrival_rate
+            type_probabilities = [1 / len(CustomerType)] * len(CustomerType)
+        else:
+            arrival_rate = env.arrival_profile[period.value]
+            type_probabilities = CUSTOMER_TYPE_PROBABILITY_TABLE[period.value]
+        mean, scv = service_time_moments(type_probabilities)
+        estimates = {n: estimate_queue(arrival_rate, int(n), mean, scv).expected_queue_per_lane
+                     for n in np.unique(n_checkouts[in_period])}
+        estimated = np.array([estimates[n] for n in n_checkouts[in_period]])
+        comparison[period] = (float(simulated[in_period].mean()), float(estimated.mean()))
+    return comparison
@@ -0,0 +1,63 @@
+import numpy as np
+
+# Independent named random streams derived from one seed. Each stream is a
+# child of SeedSequence(seed), so the arrivals a simulation sees do not depend
+# on how many exploration draws an agent made (and vice versa), and two runs
+# with the same seed see the same customers whatever policy is in charge.
+# New names go at the end: child streams are keyed by position, so appending
+# one leaves the existing streams of a seed unchanged.
+STREAM_NAMES = ('arrivals', 'customer_types', 'service_times', 'exploration', 'replay')
+
+def make_generator(seed, name):
+    return np.random.default_rng(np.random.SeedSequence(seed).spawn(len(STREAM_NAMES))[STREAM_NAMES.index(name)])
+
+
+# Drop-in for the parts of the random module the simulation uses, backed by a
+# numpy Generator. Uniforms and exponentials are drawn in blocks of batch_size
+# and handed out one at a time.
+class BatchedRandom:
+    def __init__(self, generator, batch_size=4096):
+        self.generator = generator
+        self.batch_size = batch_size
+        self._uniforms = []
+        self._uniform_pos = 0
+        self._exponentials = []
+        self._exponential_pos = 0
+
+    def random(self):
+        if self._uniform_pos == len(self._uniforms):
+            self._uniforms = self.generator.random(self.batch_size).tolist()
+            self._uniform_pos = 0
+        value = self._uniforms[self._uniform_pos]
+        self._uniform_pos += 1
+        return value
+
+    def uniform(self, a, b):
+        return a + (b - a) * self.random()
+
+    def integers(self, n):
+        return int(self.random() * n)
+
+    def expovariate(self, lambd):
+        if self._exponential_pos == len(self._exponentials):
+            self._exponentials = self.generator.standard_exponential(self.batch_size).tolist()
+            self._exponential_pos = 0
+        value = self._exponentials[self._exponential_pos]
+        self._exponential_pos += 1
+        return value / lambd
+
+
+class RandomStreams:
+    def __init__(self, seed=None, batch_size=4096):
+        # With seed=None fresh OS entropy is used, but all streams still come
+        # from the one SeedSequence, whose entropy can be read back to replay it
+        self.seed_sequence = np.random.SeedSequence(seed)
+        children = self.seed_sequence.spawn(len(STREAM_NAMES))
+        self.generators = {name: np.random.default_rng(child) for name, child in zip(STREAM_NAMES, children)}
+        self.arrivals = BatchedRandom(self.generators['arrivals'], batch_size)
+        self.service_times = BatchedRandom(self.generators['service_times'], batch_size)
+        self.exploration = BatchedRandom(self.generators['exploration'], batch_size)
+
+    @property
+    def entropy(self):
+        return self.seed_sequence.entropy
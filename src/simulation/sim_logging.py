@@ -0,0 +1,54 @@
+import json
+import logging
+import sys
+
+# Progress messages go through this logger. Nothing is printed until
+# configure_logging() attaches a handler, so library use is silent by default.
+logger = logging.getLogger('checkout_simulation')
+
+LEVELS = {
+    'quiet': logging.CRITICAL + 1,
+    'warning': logging.WARNING,
+    'info': logging.INFO,
+    'debug': logging.DEBUG,
+}
+
+def configure_logging(level='info', stream=None):
+    logger.setLevel(LEVELS[level])
+    logger.propagate = False
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    if level != 'quiet':
+        handler = logging.StreamHandler(stream if stream is not None else sys.stdout)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+
+
+# JSON-lines stream of per-customer simulation events (arrival, queue_join,
+# service_complete). Simulation code only builds an event when a stream is
+# attached, so the default of events=None costs a single None check.
+class EventStream:
+    def __init__(self, target):
+        if isinstance(target, str):
+            self._file = open(target, 'w')
+            self._owns_file = True
+        else:
+            self._file = target
+            self._owns_file = False
+
+    def emit(self, event, time, **fields):
+        record = {'event': event, 'time': time}
+        record.update(fields)
+        self._file.write(json.dumps(record) + '\n')
+
+    def close(self):
+        if self._owns_file:
+            self._file.close()
+        else:
+            self._file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,317 @@
+import numpy as np
+from .customer import (CustomerType, SHOPPING_TIME_RANGES, CHECKOUT_TIME_RANGES, get_time_period,
+                       MINUTES_PER_DAY, PERIOD_INDEX_BY_MINUTE, ARRIVAL_RATE_TABLE, CUSTOMER_TYPE_PROBABILITY_TABLE)
+
+# Advances n_envs independent stores one minute per step() using array state
+# instead of SimPy processes. Arrivals, customer types and service times follow
+# the same distributions as SimulationEnvironment: like there, a customer's
+# type and both of its times are drawn on arrival. Each lane holds a FIFO of
+# its customers' checkout times and the service time its front customer has
+# left.
+#
+# Shoppers reach the checkouts at a fractional time within a minute. They pick
+# a lane at the start of that minute, in order of arrival, but a lane cannot
+# start serving one of them before the moment they actually arrive. Checkout
+# times are at least a minute, so at most one customer starts service per lane
+# per minute, and only the earliest joiner of each lane needs its arrival time.
+# What remains approximate is the lane choice: all of a minute's joiners see
+# the queues as they stood at the start of that minute.
+#
+# With time_of_day=True, arrival rates and the customer type mix follow the
+# customer.py tables for the simulated minute of day (starting at start_minute)
+# instead of the flat arrival_rate with equally likely types.
+#
+# replicas maps each store to a random-number replica. Stores sharing a replica
+# see exactly the same customers (common random numbers), which is what
+# comparing staffing plans against each other needs.
+# By default every store is its own replica.
+#
+# arrival_scale multiplies the arrival rate, either for all stores or per
+# replica (per store without replicas), e.g. to model busier stores or days.
+class VectorSimulationEnvironment:
+    def __init__(self, n_envs, duration=1020, initial_counters=5, max_checkouts=16,
+                 min_checkouts=3, arrival_rate=1/5, seed=None, time_of_day=False, start_minute=0,
+                 replicas=None, arrival_scale=1.0, queue_depth=16):
+        self.n_envs = n_envs
+        self.duration = duration
+        self.initial_counters = initial_counters
+        self.max_checkouts = max_checkouts
+        self.min_checkouts = min_checkouts
+        self.arrival_rate = arrival_rate
+        self.time_of_day = time_of_day
+        self.start_minute = start_minute
+
+        if replicas is None:
+            self.replicas = None
+            self.n_replicas = n_envs
+        else:
+            self.replicas = np.asarray(replicas, dtype=np.int64)
+            self.n_replicas = int(self.replicas.max()) + 1
+            # Stores of each replica, for copying a replica's shoppers to them
+            self._replica_envs = np.argsort(self.replicas, kind='stable')
+            self._replica_sizes = np.bincount(self.replicas, minlength=self.n_replicas)
+            self._replica_starts = np.cumsum(self._replica_sizes) - self._replica_sizes
+        self.arrival_scale = np.broadcast_to(np.asarray(arrival_scale, dtype=float), (self.n_replicas,))
+
+        customer_types = list(CustomerType)
+        self.type_probabilities = np.full(len(customer_types), 1 / len(customer_types))
+        self.shopping_ranges = np.array([SHOPPING_TIME_RANGES[t] for t in customer_types], dtype=float)
+        self.checkout_ranges = np.array([CHECKOUT_TIME_RANGES[t] for t in customer_types], dtype=float)
+
+        # pending[k] holds (replica, fraction of the minute, checkout time)
+        # arrays of shoppers who reach the checkouts k minutes after the
+        # current head of the ring
+        self.horizon = int(np.ceil(self.shopping_ranges[:, 1].max())) + 1
+        self.pending = [[] for _ in range(self.horizon)]
+
+        self.open = np.zeros((n_envs, max_checkouts), dtype=bool)
+        self.queue_lengths = np.zeros((n_envs, max_checkouts), dtype=np.int32)
+        self.remaining_service = np.zeros((n_envs, max_checkouts))
+        # Ring buffer per lane of the queued customers' checkout times, front
+        # customer at queue_front modulo the depth; doubled in depth whenever a
+        # lane fills it
+        self.checkout_times = np.zeros((n_envs, max_checkouts, queue_depth))
+        self.queue_front = np.zeros((n_envs, max_checkouts), dtype=np.int64)
+        # Per lane, for the current minute: customers held before this minute's
+        # joiners, and when the first of this minute's joiners arrived
+        self.queue_before = np.zeros((n_envs, max_checkouts), dtype=np.int32)
+        self.first_join = np.zeros((n_envs, max_checkouts))
+        self.n_checkouts = np.zeros(n_envs, dtype=np.int32)
+        self.customer_count = np.zeros(n_envs, dtype=np.int64)
+        self.served_count = np.zeros(n_envs, dtype=np.int64)
+        self.reset(seed)
+
+    def reset(self, seed=None):
+        # Back to time 0 in place, with the random stream restarted from seed,
+        # so a reset environment runs exactly like a new one with that seed
+        self.rng = np.random.default_rng(seed)
+        self.current_time = 0
+        self.head = 0
+        self.open[:] = False
+        self.open[:, :self.initial_counters] = True
+        self.queue_lengths[:] = 0
+        self.remaining_service[:] = 0
+        self.queue_front[:] = 0
+        for chunks in self.pending:
+            chunks.clear()
+        self.n_checkouts[:] = self.initial_counters
+        self.customer_count[:] = 0
+        self.served_count[:] = 0
+
+    def step(self):
+        arrival_rate, type_probabilities = self._current_rates()
+        self._generate_arrivals(arrival_rate, type_probabilities)
+        self._join_queues()
+        self._serve()
+        self.current_time += 1
+
+    def _current_rates(self):
+        if self.time_of_day:
+            period = PERIOD_INDEX_BY_MINUTE[(self.start_minute + self.current_time) % MINUTES_PER_DAY]
+            return ARRIVAL_RATE_TABLE[period], CUSTOMER_TYPE_PROBABILITY_TABLE[period]
+        return self.arrival_rate, self.type_probabilities
+
+    def _per_env(self, values):
+        # Broadcasts per-replica values to the stores using each replica
+        return values if self.replicas is None else values[self.replicas]
+
+    def _generate_arrivals(self, arrival_rate, type_probabilities):
+        counts = self.rng.poisson(arrival_rate * self.arrival_scale)
+        total = int(counts.sum())
+        if total == 0:
+            return
+        self.customer_count += self._per_env(counts)
+
+        replica_idx = np.repeat(np.arange(self.n_replicas), counts)
+        types = self.rng.choice(len(type_probabilities), size=total, p=type_probabilities)
+        arrival_offset = self.rng.random(total)
+        shopping_time = self.rng.uniform(self.shopping_ranges[types, 0], self.shopping_ranges[types, 1])
+        checkout_time = self.rng.uniform(self.checkout_ranges[types, 0], self.checkout_ranges[types, 1])
+        reach_time = arrival_offset + shopping_time
+        join_minute = reach_time.astype(np.int64)
+        fractions = reach_time - join_minute
+
+        order = np.argsort(join_minute, kind='stable')
+        join_minute = join_minute[order]
+        starts = np.flatnonzero(np.r_[True, join_minute[1:] != join_minute[:-1]])
+        for minute, chunk in zip(join_minute[starts], np.split(order, starts[1:])):
+            self.pending[(self.head + minute) % self.horizon].append(
+                (replica_idx[chunk], fractions[chunk], checkout_time[chunk]))
+
+    def _join_queues(self):
+        chunks = self.pending[self.head]
+        self.pending[self.head] = []
+        self.head = (self.head + 1) % self.horizon
+        self.queue_before[:] = self.queue_lengths
+        if not chunks:
+            return
+        replica_idx, fractions, times = (np.concatenate(column) for column in zip(*chunks))
+        if self.replicas is None:
+            envs = replica_idx
+        else:
+            # Every store of a replica gets a copy of its shoppers
+            sizes = self._replica_sizes[replica_idx]
+            offsets = np.arange(int(sizes.sum())) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+            envs = self._replica_envs[np.repeat(self._replica_starts[replica_idx], sizes) + offsets]
+            fractions = np.repeat(fractions, sizes)
+            times = np.repeat(times, sizes)
+        self._assign_to_shortest(envs, fractions, times)
+
+    def _assign_to_shortest(self, envs, fractions, times):
+        # Customers pick the shortest open lane one at a time, in order of
+        # arrival within each store
+        if envs.size == 0:
+            return
+        order = np.lexsort((fractions, envs))
+        envs, fractions, times = envs[order], fractions[order], times[order]
+        group_start = np.flatnonzero(np.r_[True, envs[1:] != envs[:-1]])
+        rank = np.arange(len(envs)) - np.repeat(group_start, np.diff(np.r_[group_start, len(envs)]))
+        by_rank = np.argsort(rank, kind='stable')
+        bounds = np.cumsum(np.bincount(rank))[:-1]
+        open_lengths = np.where(self.open, self.queue_lengths, np.iinfo(np.int32).max)
+        for chunk in np.split(by_rank, bounds):
+            active = envs[chunk]
+            lanes = open_lengths[active].argmin(axis=1)
+            length = self.queue_lengths[active, lanes]
+            open_lengths[active, lanes] += 1
+            if length.max() >= self.checkout_times.shape[2]:
+                self._deepen_queues()
+            depth = self.checkout_times.shape[2]
+            self.checkout_times[active, lanes, (self.queue_front[active, lanes] + length) % depth] = times[chunk]
+            first = length == self.queue_before[active, lanes]
+            self.first_join[active[first], lanes[first]] = fractions[chunk][first]
+            self.queue_lengths[active, lanes] += 1
+
+    def _deepen_queues(self):
+        depth = self.checkout_times.shape[2]
+        in_order = (self.queue_front[:, :, np.newaxis] + np.arange(depth)) % depth
+        checkout_times = np.zeros(self.checkout_times.shape[:2] + (2 * depth,))
+        checkout_times[:, :, :depth] = np.take_along_axis(self.checkout_times, in_order, axis=2)
+        self.checkout_times = checkout_times
+        self.queue_front[:] = 0
+
+    def _serve(self):
+        # Works on the lanes holding anyone, as flat indices into (store, lane)
+        lanes = np.flatnonzero(self.queue_lengths)
+        queue_lengths = self.queue_lengths.reshape(-1)[lanes]
+        queue_front = self.queue_front.reshape(-1)[lanes]
+        remaining = self.remaining_service.reshape(-1)[lanes]
+        queue_before = self.queue_before.reshape(-1)[lanes]
+        first_join = self.first_join.reshape(-1)[lanes]
+        checkout_times = self.checkout_times.reshape(self.queue_lengths.size, -1)
+        depth = checkout_times.shape[1]
+        budget = np.ones(len(lanes))  # time left in the minute
+        served = np.zeros(len(lanes), dtype=np.int32)
+
+        active = np.arange(len(lanes))
+        while active.size:
+            starting = active[remaining[active] <= 0]
+            if starting.size:
+                remaining[starting] = checkout_times[lanes[starting], queue_front[starting] % depth]
+                # Everyone held before this minute is done, so the one starting
+                # is this minute's first joiner and cannot start before arriving
+                joined = starting[served[starting] >= queue_before[starting]]
+                budget[joined] = np.minimum(budget[joined], 1 - first_join[joined])
+
+            used = np.minimum(remaining[active], budget[active])
+            remaining[active] -= used
+            budget[active] -= used
+
+            finished = active[remaining[active] <= 1e-9]
+            queue_lengths[finished] -= 1
+            queue_front[finished] += 1
+            served[finished] += 1
+            remaining[finished] = 0
+            active = active[(queue_lengths[active] > 0) & (budget[active] > 1e-9)]
+
+        self.queue_lengths.reshape(-1)[lanes] = queue_lengths
+        self.queue_front.reshape(-1)[lanes] = queue_front
+        self.remaining_service.reshape(-1)[lanes] = remaining
+        self.served_count += np.bincount(lanes // self.max_checkouts, weights=served,
+                                         minlength=self.n_envs).astype(np.int64)
+
+    def _as_mask(self, envs):
+        if envs is None:
+            return np.ones(self.n_envs, dtype=bool)
+        envs = np.asarray(envs)
+        if envs.dtype == bool:
+            return envs
+        mask = np.zeros(self.n_envs, dtype=bool)
+        mask[envs] = True
+        return mask
+
+    def add_checkout(self, envs=None):
+        rows = np.flatnonzero(self._as_mask(envs) & (self.n_checkouts < self.max_checkouts))
+        if rows.size == 0:
+            return
+        lanes = (~self.open[rows]).argmax(axis=1)  # first closed lane
+        self.open[rows, lanes] = True
+        self.n_checkouts[rows] += 1
+
+    def remove_checkout(self, envs=None):
+        # Ensure at least min_checkouts remain open. Like SimulationEnvironment,
+        # customers still queued at the removed lane are no longer counted.
+        rows = np.flatnonzero(self._as_mask(envs) & (self.n_checkouts > self.min_checkouts))
+        self._close_shortest(rows)
+
+    def _close_shortest(self, rows):
+        # Closes the shortest open lane in each of rows and returns the
+        # (store, checkout time) of every customer queued there; whoever was
+        # being served keeps the service time they had left
+        if rows.size == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        lengths = np.where(self.open[rows], self.queue_lengths[rows], np.iinfo(np.int32).max)
+        lanes = lengths.argmin(axis=1)
+        counts = self.queue_lengths[rows, lanes]
+        depth = self.checkout_times.shape[2]
+        owners = np.repeat(np.arange(len(rows)), counts)
+        position = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+        slots = (self.queue_front[rows, lanes][owners] + position) % depth
+        times = self.checkout_times[rows[owners], lanes[owners], slots]
+        in_service = (position == 0) & (self.remaining_service[rows, lanes][owners] > 0)
+        times[in_service] = self.remaining_service[rows, lanes][owners][in_service]
+
+        self.open[rows, lanes] = False
+        self.queue_lengths[rows, lanes] = 0
+        self.remaining_service[rows, lanes] = 0
+        self.n_checkouts[rows] -= 1
+        return rows[owners], times
+
+    def set_checkouts(self, counts, requeue=True):
+        # Opens or closes lanes until each store has counts[i] open (clipped to
+        # [min_checkouts, max_checkouts]). With requeue, customers at closed
+        # lanes move to the shortest remaining lanes instead of disappearing.
+        target = np.clip(np.broadcast_to(counts, (self.n_envs,)), self.min_checkouts, self.max_checkouts)
+        while True:
+            rows = np.flatnonzero(self.n_checkouts < target)
+            if rows.size == 0:
+                break
+            self.add_checkout(rows)
+
+        displaced_envs, displaced_times = [], []
+        while True:
+            rows = np.flatnonzero(self.n_checkouts > target)
+            if rows.size == 0:
+                break
+            envs, times = self._close_shortest(rows)
+            displaced_envs.append(envs)
+            displaced_times.append(times)
+        if requeue and displaced_envs:
+            envs = np.concatenate(displaced_envs)
+            # Requeued customers are there from the start of the minute
+            self._assign_to_shortest(envs, np.zeros(len(envs)), np.concatenate(displaced_times))
+
+    def apply_actions(self, actions):
+        # Same action encoding as run_episode: 0 = hold, 1 = add, 2 = remove
+        actions = np.asarray(actions)
+        self.add_checkout(actions == 1)
+        self.remove_checkout(actions == 2)
+
+    def get_queue_lengths(self):
+        return np.where(self.open, self.queue_lengths, 0)
+
+    def get_average_queue_length(self):
+        return self.get_queue_lengths().sum(axis=1) / self.n_checkouts
+
+    def get_current_time_period(self):
+        return get_time_period(self.start_minute + self.current_time)